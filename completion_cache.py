@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+import json
+import time
+import sqlite3
+import threading
+import hashlib
+from array import array
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def completion_key(model_name, prompt, sampling_config, seed, guided=None, owner=None):
+    payload = {
+        "model": model_name,
+        "prompt": text_hash(prompt),
+        "params": sampling_config,
+        "seed": seed
+    }
+    # Left out when unset so keys of unconstrained completions stay the same
+    if guided:
+        payload["guided"] = guided
+    if owner:
+        payload["owner"] = owner
+    return text_hash(json.dumps(payload, sort_keys=True))
+
+class CompletionCache:
+    def __init__(self, path, max_bytes=2 * 1024 ** 3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # With --stream-window, lookups run on whichever thread pulls the request feed
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, completion TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+
+    def get(self, key):
+        with self.lock:
+            return self._get(key)
+
+    def _get(self, key):
+        row = self.conn.execute("SELECT completion FROM completions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key, completion):
+        with self.lock:
+            self._put(key, completion)
+
+    def _put(self, key, completion):
+        size = len(completion.encode('utf-8'))
+        old = self.conn.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO completions (key, completion, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, completion, size, time.time())
+        )
+        self.total_bytes += size - (old[0] if old else 0)
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+        self.conn.commit()
+
+    def evict(self):
+        # Least recently used entries go first, down to 90% of the budget to avoid evicting on every put
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        rows = self.conn.execute("SELECT key, size FROM completions ORDER BY last_used").fetchall()
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            self.conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+            self.total_bytes -= size
+            evicted += 1
+        if evicted:
+            print(f"Evicted {evicted} entries from completion cache {self.path}")
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+class TokenCache:
+    # Token ids per (tokenizer, prompt), so reruns skip tokenization entirely
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        # Filled by the ingestion thread while the model loads, then read from the main thread
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, ids BLOB NOT NULL)")
+        self.conn.commit()
+
+    def get_many(self, keys):
+        found = {}
+        # Stay below SQLite's limit on bound parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT key, ids FROM tokens WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for key, ids in rows:
+                found[key] = array('I', ids).tolist()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO tokens (key, ids) VALUES (?, ?)",
+            [(key, array('I', ids).tobytes()) for key, ids in items]
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+import os
+import re
+import json
+import glob
+import random
+import sys
+import fnmatch
+import time
+import argparse
+import hashlib
+import subprocess
+import shutil
+import tempfile
+from cvdp_problems import DIFFICULTIES
+from completion_cache import text_hash
+from response_io import read_responses, open_response_writer
+
+HF_DATASET_DIR = "datasets--nvidia--cvdp-benchmark-dataset"
+DEFAULT_CONFIG = "cvdp_nonagentic_code_generation_no_commercial"
+
+# Store layout: one uncompressed Arrow IPC file, which is memory-mapped on open, and a small JSON index
+TABLE_FILE = "problems.arrow"
+INDEX_FILE = "index.json"
+
+def find_dataset_file(hf_home=None, config=DEFAULT_CONFIG):
+    # The JSONL that load_dataset leaves in the Hugging Face cache
+    hf_home = hf_home or os.environ.get("HF_HOME", os.path.expanduser("~/.cache/huggingface"))
+    pattern = os.path.join(hf_home, "hub", HF_DATASET_DIR, "**", "*.jsonl")
+    name = re.compile(".*".join(["cvdp"] + config.split("_")[1:]))
+    matches = sorted(p for p in glob.glob(pattern, recursive=True) if name.search(os.path.basename(p)))
+    return matches[0] if matches else None
+
+def read_dataset(dataset_file):
+    with open(dataset_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def harness_services(compose_text):
+    # Service names under the top-level "services:" key of a docker-compose file
+    services = []
+    in_services = False
+    for line in compose_text.splitlines():
+        if re.match(r"\S", line):
+            in_services = line.rstrip() == "services:"
+            continue
+        match = re.match(r"^  ([A-Za-z0-9_.-]+):", line)
+        if in_services and match:
+            services.append(match.group(1))
+    return services
+
+def harness_files(record):
+    return (record.get("harness") or {}).get("files") or {}
+
+def problem_fields(record):
+    categories = record.get("categories", [])
+    compose = harness_files(record).get("docker-compose.yml") or ""
+    return {
+        "id": record["id"],
+        "category": next((c for c in categories if c.startswith("cid")), None),
+        "difficulty": next((c for c in categories if c in DIFFICULTIES), None),
+        "harness_type": ",".join(harness_services(compose))
+    }
+
+def problem_hashes(record):
+    # What the model sees (prompt, context) is hashed apart from what only the evaluation uses
+    # (harness files and reference output), so a harness-only change keeps its responses
+    canonical = lambda value: json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return {
+        "prompt": text_hash(canonical((record.get("input") or {}).get("prompt"))),
+        "context": text_hash(canonical((record.get("input") or {}).get("context"))),
+        "harness": text_hash(canonical([harness_files(record), (record.get("output") or {}).get("context")]))
+    }
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def snapshot_is_current(dataset_file, store_dir):
+    # The store was built from a file with the same content
+    if not (is_store(store_dir) and os.path.isfile(os.path.join(store_dir, TABLE_FILE))):
+        return False
+    with open(os.path.join(store_dir, INDEX_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f).get("sha256") == file_sha256(dataset_file)
+
+def snapshot(dataset_file, store_dir):
+    import pyarrow as pa
+
+    os.makedirs(store_dir, exist_ok=True)
+    columns = {"id": [], "category": [], "difficulty": [], "harness_type": [], "record": []}
+    hashes = {}
+    for record in read_dataset(dataset_file):
+        for name, value in problem_fields(record).items():
+            columns[name].append(value)
+        columns["record"].append(json.dumps(record, ensure_ascii=False))
+        hashes[record["id"]] = problem_hashes(record)
+
+    # Rows sorted by id, so an id lookup is a dictionary hit and the filters are row lists
+    order = sorted(range(len(columns["id"])), key=lambda i: columns["id"][i])
+    table = pa.table({name: [values[i] for i in order] for name, values in columns.items()})
+    with pa.OSFile(os.path.join(store_dir, TABLE_FILE), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    index = {"source": os.path.abspath(dataset_file), "sha256": file_sha256(dataset_file), "count": table.num_rows,
+             "id": {}, "category": {}, "difficulty": {}, "harness_type": {}, "hash": hashes}
+    for row, problem_id in enumerate(table.column("id").to_pylist()):
+        index["id"][problem_id] = row
+    for name in ("category", "difficulty"):
+        for row, value in enumerate(table.column(name).to_pylist()):
+            index[name].setdefault(value or "unknown", []).append(row)
+    for row, value in enumerate(table.column("harness_type").to_pylist()):
+        for service in (value.split(",") if value else ["unknown"]):
+            index["harness_type"].setdefault(service, []).append(row)
+    with open(os.path.join(store_dir, INDEX_FILE), 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    return index
+
+class DatasetStore:
+    def __init__(self, store_dir):
+        import pyarrow as pa
+
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, INDEX_FILE), 'r', encoding='utf-8') as f:
+            self.index = json.load(f)
+        # Memory-mapped, so only the rows that are read come off the disk
+        self.table = pa.ipc.open_file(pa.memory_map(os.path.join(store_dir, TABLE_FILE), 'r')).read_all()
+
+    def __len__(self):
+        return self.index["count"]
+
+    def ids(self):
+        return list(self.index["id"])
+
+    def fields(self, row):
+        return {name: self.table.column(name)[row].as_py() for name in ("id", "category", "difficulty", "harness_type")}
+
+    def record(self, row):
+        return json.loads(self.table.column("record")[row].as_py())
+
+    def get(self, problem_id):
+        row = self.index["id"].get(problem_id)
+        return None if row is None else self.record(row)
+
+    def select(self, id_glob=None, category=None, difficulty=None, harness_type=None, sample=None, seed=0):
+        # Rows matching every given filter; comma-separated values within one filter match any of them
+        rows = set(range(len(self)))
+        if id_glob:
+            patterns = id_glob.split(",")
+            rows &= {row for problem_id, row in self.index["id"].items() if any(fnmatch.fnmatchcase(problem_id, p) for p in patterns)}
+        for name, values in (("category", category), ("difficulty", difficulty), ("harness_type", harness_type)):
+            if values:
+                rows &= {row for value in values.split(",") for row in self.index[name].get(value, [])}
+        rows = sorted(rows)
+        if sample is not None and sample < len(rows):
+            rows = self.stratified_sample(rows, sample, seed)
+        return rows
+
+    def stratified_sample(self, rows, k, seed):
+        # K rows spread over category x difficulty in proportion to each stratum's size (largest remainder)
+        categories = self.table.column("category").to_pylist()
+        difficulties = self.table.column("difficulty").to_pylist()
+        strata = {}
+        for row in rows:
+            strata.setdefault((categories[row] or "", difficulties[row] or ""), []).append(row)
+        quotas = {key: k * len(members) / len(rows) for key, members in strata.items()}
+        counts = {key: int(quota) for key, quota in quotas.items()}
+        for key in sorted(quotas, key=lambda key: (counts[key] - quotas[key], key))[:k - sum(counts.values())]:
+            counts[key] += 1
+        rng = random.Random(seed)
+        return sorted(row for key, members in sorted(strata.items()) for row in rng.sample(members, counts[key]))
+
+    def records(self, rows):
+        # Streams the selected records in row order, decoding one at a time
+        column = self.table.column("record")
+        for row in rows:
+            yield json.loads(column[row].as_py())
+
+    def metadata(self):
+        # {id: {category, difficulty}} as cvdp_problems.load_problem_metadata returns it
+        categories = self.table.column("category").to_pylist()
+        difficulties = self.table.column("difficulty").to_pylist()
+        return {problem_id: {"category": categories[row], "difficulty": difficulties[row]} for problem_id, row in self.index["id"].items()}
+
+def is_store(path):
+    return bool(path) and os.path.isfile(os.path.join(path, INDEX_FILE))
+
+def open_records(path):
+    # Every record of a store directory or a dataset JSONL
+    if is_store(path):
+        store = DatasetStore(path)
+        return store.records(range(len(store)))
+    return read_dataset(path)
+
+def load_hashes(path):
+    if is_store(path):
+        store = DatasetStore(path)
+        if "hash" in store.index:
+            return store.index["hash"]
+    return {record["id"]: problem_hashes(record) for record in open_records(path)}
+
+def dataset_diff(old, new):
+    manifest = {"added": sorted(set(new) - set(old)), "removed": sorted(set(old) - set(new)), "changed": {}, "unchanged": []}
+    for problem_id in sorted(set(old) & set(new)):
+        parts = [part for part in new[problem_id] if new[problem_id][part] != old[problem_id].get(part)]
+        if parts:
+            manifest["changed"][problem_id] = parts
+        else:
+            manifest["unchanged"].append(problem_id)
+    # Responses stay valid unless the model input changed; everything but the unchanged needs evaluating again
+    manifest["regenerate"] = sorted(manifest["added"] + [i for i, parts in manifest["changed"].items() if {"prompt", "context"} & set(parts)])
+    manifest["reevaluate"] = sorted(manifest["added"] + list(manifest["changed"]))
+    return manifest
+
+def carry_over_responses(manifest, old_responses, new_responses):
+    # Copies the responses that are still valid, so the driver's --resume only generates the rest
+    regenerate = set(manifest["regenerate"]) | set(manifest["removed"])
+    kept = 0
+    with open_response_writer(new_responses) as writer:
+        for record in read_responses(old_responses):
+            if record["id"] not in regenerate:
+                writer.write(record["id"], record["completion"], record.get("sample"), record.get("num_tokens"), record.get("finish_reason"))
+                kept += 1
+    return kept
+
+def benchmark_command(benchmark_dir, dataset_file, output, prefix, threads=1):
+    # The run_benchmark.py invocation run_samples.py makes for each sample (see its run.log), made once and without
+    # --external-network: with --model local_export the benchmark builds and writes the prompts and skips execution
+    script = os.path.join(os.path.abspath(benchmark_dir), "run_benchmark.py")
+    if not os.path.isfile(script):
+        raise FileNotFoundError(f"no cvdp_benchmark checkout at {benchmark_dir} (git submodule update --init)")
+    return [sys.executable, script,
+            "--filename", dataset_file,
+            "--model", "local_export",
+            "--threads", str(threads),
+            "--prompts-responses-file", output,
+            "--prefix", prefix]
+
+def problem_files(record):
+    context = (record.get("input") or {}).get("context") or {}
+    outputs = list(((record.get("output") or {}).get("context") or {}))
+    return context, outputs
+
+def export_prompts(dataset, benchmark_dir, output, context_output=None, workdir=None, threads=1):
+    # Runs run_benchmark.py once with the local_export model, so every prompt is built by the benchmark's own code and
+    # written once, however many samples are drawn later. run_samples.py and its Docker network are never involved.
+    workdir = os.path.abspath(workdir or tempfile.mkdtemp(prefix="cvdp_export_"))
+    os.makedirs(workdir, exist_ok=True)
+    output = os.path.abspath(output)
+    records = list(open_records(dataset))
+    dataset_file = os.path.abspath(dataset)
+    if is_store(dataset):
+        # The benchmark reads a dataset JSONL
+        dataset_file = os.path.join(workdir, "dataset.jsonl")
+        with open(dataset_file, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    if os.path.exists(output):
+        os.remove(output)
+
+    command = benchmark_command(benchmark_dir, dataset_file, output, os.path.join(workdir, "export"), threads)
+    # Started from its checkout, as run_samples.py does, so that it finds its configuration; an option this
+    # release does not know makes it exit with an error instead of being dropped
+    result = subprocess.run(command, cwd=os.path.abspath(benchmark_dir))
+    if result.returncode != 0:
+        raise RuntimeError(f"run_benchmark.py exited with status {result.returncode}: {' '.join(command)}")
+
+    exported = set()
+    if os.path.exists(output):
+        with open(output, 'r', encoding='utf-8') as f:
+            exported = {json.loads(line)["id"] for line in f if line.strip()}
+    missing = [record["id"] for record in records if record["id"] not in exported]
+
+    if context_output:
+        with open(context_output, 'w', encoding='utf-8') as f:
+            for record in records:
+                context, outputs = problem_files(record)
+                f.write(json.dumps({record["id"]: {"input": context, "output": {path: "" for path in outputs}, "obj": True}}, ensure_ascii=False) + '\n')
+    return len(exported), missing, workdir
+
+def main():
+    parser = argparse.ArgumentParser(description="Indexed local snapshot of the CVDP dataset")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    snap = commands.add_parser("snapshot", help="Convert a dataset JSONL into an indexed, memory-mapped store")
+    snap.add_argument("store", help="Store directory to create")
+    snap.add_argument("--dataset-file", default=None, help="Dataset JSONL (default: the one downloaded into HF_HOME)")
+    snap.add_argument("--config", default=DEFAULT_CONFIG, help="Dataset configuration to look for in HF_HOME")
+    snap.add_argument("--force", action="store_true", help="Rebuild even if the store was made from the same dataset file content")
+
+    show = commands.add_parser("show", help="Print one problem as JSON")
+    show.add_argument("store", help="Store directory")
+    show.add_argument("id", help="Problem id")
+
+    export = commands.add_parser("export", help="Write the problems matching the filters as a dataset JSONL for run_samples.py -f")
+    export.add_argument("store", help="Store directory")
+    export.add_argument("output", help="Dataset JSONL to write")
+    export.add_argument("--id-glob", default=None, help="Problem id pattern(s), e.g. 'cvdp_copilot_fifo*' (comma-separated)")
+    export.add_argument("--category", default=None, help="Categories to keep, e.g. cid003,cid016")
+    export.add_argument("--difficulty", default=None, help="Difficulties to keep, e.g. easy,medium")
+    export.add_argument("--harness", default=None, help="Harness service types to keep, e.g. direct,lint")
+    export.add_argument("--sample", type=int, default=None, help="Keep a random sample of K matching problems, stratified by category and difficulty")
+    export.add_argument("--seed", type=int, default=0, help="Seed for --sample")
+
+    diff = commands.add_parser("diff", help="Compare two dataset versions and list added, removed and changed problems")
+    diff.add_argument("old", help="Previous dataset JSONL or store directory")
+    diff.add_argument("new", help="New dataset JSONL or store directory")
+    diff.add_argument("-o", "--output", default="dataset_diff.json", help="Manifest to write")
+    diff.add_argument("--responses", default=None, help="Responses generated for the old version")
+    diff.add_argument("--carry-over", default=None, help="New responses file seeded with the still valid responses; finish it with local_inference_vllm.py --resume")
+    diff.add_argument("--affected-dataset", default=None, help="Dataset JSONL of the new problems that need evaluating again, for run_samples.py -f")
+
+    prompts = commands.add_parser("prompts", help="Write exported_prompts.jsonl with one local_export run of run_benchmark.py, whatever the sample count")
+    prompts.add_argument("dataset", help="Dataset JSONL or store directory")
+    prompts.add_argument("--benchmark", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "cvdp_benchmark"), help="cvdp_benchmark checkout whose prompt builder is used (default: the submodule)")
+    prompts.add_argument("-o", "--output", default="exported_prompts.jsonl", help="Prompts file to write, one line per problem")
+    prompts.add_argument("--context-output", default=None, help="Also write the prompt_response.jsonl context file the export step leaves in its results")
+    prompts.add_argument("--workdir", default=None, help="Keep the per-problem files of the preparation phase here (default: a temporary directory, removed afterwards)")
+    prompts.add_argument("--threads", type=int, default=1, help="Threads for run_benchmark.py's preparation phase")
+
+    stats = commands.add_parser("stats", help="Count problems per category, difficulty and harness type")
+    stats.add_argument("store", help="Store directory")
+
+    args = parser.parse_args()
+    if args.command == "snapshot":
+        dataset_file = args.dataset_file or find_dataset_file(config=args.config)
+        if not dataset_file:
+            parser.error("no dataset JSONL found in HF_HOME; run download.py or pass --dataset-file")
+        if not args.force and snapshot_is_current(dataset_file, args.store):
+            print(f"Snapshot in {args.store} is up to date with {dataset_file}")
+            return
+        start = time.perf_counter()
+        index = snapshot(dataset_file, args.store)
+        print(f"Snapshot of {index['count']} problems from {dataset_file} written to {args.store} in {time.perf_counter() - start:.2f}s")
+    elif args.command == "show":
+        record = DatasetStore(args.store).get(args.id)
+        if record is None:
+            parser.error(f"unknown problem id: {args.id}")
+        print(json.dumps(record, indent=2, ensure_ascii=False))
+    elif args.command == "export":
+        start = time.perf_counter()
+        store = DatasetStore(args.store)
+        rows = store.select(args.id_glob, args.category, args.difficulty, args.harness, args.sample, args.seed)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for record in store.records(rows):
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        print(f"Exported {len(rows)} of {len(store)} problems to {args.output} in {time.perf_counter() - start:.2f}s")
+    elif args.command == "diff":
+        if bool(args.responses) != bool(args.carry_over):
+            parser.error("--responses and --carry-over go together")
+        manifest = dataset_diff(load_hashes(args.old), load_hashes(args.new))
+        manifest = {"old": os.path.abspath(args.old), "new": os.path.abspath(args.new), **manifest}
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        print(f"{len(manifest['added'])} added, {len(manifest['removed'])} removed, {len(manifest['changed'])} changed, "
+              f"{len(manifest['unchanged'])} unchanged; {len(manifest['regenerate'])} to regenerate, "
+              f"{len(manifest['reevaluate'])} to evaluate again; manifest saved to {args.output}")
+        if args.carry_over:
+            kept = carry_over_responses(manifest, args.responses, args.carry_over)
+            print(f"Carried {kept} responses over to {args.carry_over}")
+        if args.affected_dataset:
+            affected = set(manifest["reevaluate"])
+            with open(args.affected_dataset, 'w', encoding='utf-8') as f:
+                for record in open_records(args.new):
+                    if record["id"] in affected:
+                        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            print(f"Problems to evaluate again written to {args.affected_dataset}")
+    elif args.command == "prompts":
+        start = time.perf_counter()
+        exported, missing, workdir = export_prompts(args.dataset, args.benchmark, args.output, args.context_output, args.workdir, args.threads)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+        if missing:
+            print(f"❌ The benchmark exported no prompt for {len(missing)} problems, e.g. {missing[0]}")
+            raise SystemExit(1)
+        print(f"Exported {exported} prompts to {args.output} in {time.perf_counter() - start:.2f}s")
+    else:
+        store = DatasetStore(args.store)
+        print(f"{len(store)} problems")
+        for name in ("category", "difficulty", "harness_type"):
+            print(f"{name}: " + ", ".join(f"{value} {len(rows)}" for value, rows in sorted(store.index[name].items())))
+
+if __name__ == "__main__":
+    main()
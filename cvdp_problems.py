@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+import os
+import re
+import ast
+import json
+from collections import defaultdict
+from response_io import read_responses
+
+DIFFICULTIES = ("easy", "medium", "hard")
+
+# Fallback when no dataset is given: map the "You are solving a '...' problem" phrase to a category
+PROBLEM_TYPE_CATEGORIES = [
+    ("code completion", "cid002"),
+    ("modification", "cid004"),
+    ("component reuse", "cid005"),
+    ("module instantiation", "cid005"),
+    ("specification to rtl", "cid003"),
+    ("lint", "cid007"),
+    ("improvement", "cid007"),
+    ("question", "cid009"),
+    ("stimulus", "cid012"),
+    ("checker", "cid013"),
+    ("assertion", "cid014"),
+    ("debug", "cid016"),
+    ("bug fix", "cid016"),
+]
+
+# Edit-heavy categories whose answers mostly copy the RTL given in the prompt
+EDIT_CATEGORIES = "cid004,cid007,cid016"
+
+def load_problem_metadata(dataset_file):
+    metadata = {}
+    if not dataset_file:
+        return metadata
+    if os.path.isdir(dataset_file):
+        # A store written by cvdp_dataset.py snapshot answers from its index without parsing the records
+        from cvdp_dataset import DatasetStore
+        return DatasetStore(dataset_file).metadata()
+    with open(dataset_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            categories = record.get("categories", [])
+            metadata[record["id"]] = {
+                "category": next((c for c in categories if c.startswith("cid")), None),
+                "difficulty": next((c for c in categories if c in DIFFICULTIES), None)
+            }
+    return metadata
+
+def problem_category(data, metadata):
+    category = metadata.get(data["id"], {}).get("category")
+    if category:
+        return category
+    match = re.search(r"You are solving an? '([^']+)' problem", data["prompt"])
+    if match:
+        problem_type = match.group(1).lower()
+        for phrase, category in PROBLEM_TYPE_CATEGORIES:
+            if phrase in problem_type:
+                return category
+    return None
+
+# Typical completion size, in tokens, for one expected output file of each type
+FILE_TYPE_TOKENS = {
+    ".sv": 1024,
+    ".v": 1024,
+    ".svh": 512,
+    ".vh": 512,
+    ".py": 768,
+    ".md": 512,
+    ".txt": 256,
+}
+DEFAULT_FILE_TOKENS = 512
+
+# Fence language written for each expected output file type
+FENCE_LANGUAGES = {
+    ".sv": "systemverilog",
+    ".svh": "systemverilog",
+    ".v": "verilog",
+    ".vh": "verilog",
+    ".py": "python",
+    ".md": "markdown",
+}
+
+# One line of a fenced code block: anything that does not itself start with ```
+# (written without lookaheads, which the guided decoding regex engines do not support)
+CODE_LINE = r"(?:[^`\n][^\n]*|`[^`\n][^\n]*|``[^`\n][^\n]*|`|``)?\n"
+
+def load_problem_context(context_file):
+    # prompt_response.jsonl written by the export step: {id: {"input": {path: text}, "output": {path: ""}}},
+    # with the value stored either as JSON or as a Python literal string
+    context = {}
+    if not context_file:
+        return context
+    with open(context_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for problem_id, value in json.loads(line).items():
+                context[problem_id] = ast.literal_eval(value) if isinstance(value, str) else value
+    return context
+
+def expected_output_files(data, context):
+    files = list(context.get(data["id"], {}).get("output", {}))
+    if files:
+        return files
+    match = re.search(r"Your response will be saved directly to: (\S+?)\.?\s*$", data["prompt"])
+    return [match.group(1)] if match else []
+
+def file_block_regex(expected_files):
+    # Each expected file as its path on a line of its own followed by a fenced block in the file's language
+    blocks = [
+        re.escape(path) + r"\n```" + FENCE_LANGUAGES.get(os.path.splitext(path)[1], "text") + r"\n(?:" + CODE_LINE + r")*```\n"
+        for path in expected_files
+    ]
+    return r"\n".join(blocks) if blocks else None
+
+FENCE = re.compile(r"^[ \t]*```[^\n]*$", re.M)
+
+def files_complete_offset(text, expected_files):
+    # Returns the offset just past the code block that completes the last expected file, or None.
+    # A block belongs to the expected path mentioned closest before it (or in its fence line);
+    # an unnamed block fills the next expected file in order.
+    if not expected_files:
+        return None
+    remaining = list(expected_files)
+    opened = None
+    last_end = 0
+    for fence in FENCE.finditer(text):
+        if opened is None:
+            opened = fence
+            continue
+        header = text[last_end:opened.end()]
+        named = [f for f in remaining if os.path.basename(f) in header]
+        if named:
+            remaining.remove(max(named, key=lambda f: header.rfind(os.path.basename(f))))
+        else:
+            remaining.pop(0)
+        opened = None
+        last_end = fence.end()
+        if not remaining:
+            return last_end
+    return None
+
+def completion_problem(text, expected_files):
+    # Why a completion cannot pass the harness, or None when it looks usable
+    if not text.strip():
+        return "empty"
+    if expected_files and files_complete_offset(text, expected_files) is None:
+        return "missing code block"
+    return None
+
+def early_stop_offset(request, text):
+    return files_complete_offset(text, request.expected_files)
+
+def approx_tokens(text):
+    # Roughly four characters per token for code and English prose
+    return len(text) // 4 + 1
+
+def load_history_lengths(history_files, categories_by_id):
+    lengths = defaultdict(list)
+    for path in history_files or []:
+        # Any responses format this driver writes: .jsonl, .jsonl.zst or .parquet
+        for record in read_responses(path):
+            if record.get("completion"):
+                lengths[categories_by_id.get(record["id"])].append(approx_tokens(record["completion"]))
+    return lengths
+
+class OutputLengthEstimator:
+    # Predicts how many tokens a completion will take: the category's median in earlier runs when
+    # there is history, otherwise the size of the expected output files or of the RTL being edited
+    def __init__(self, context=None, metadata=None, history=None):
+        self.context = context or {}
+        self.metadata = metadata or {}
+        self.history_median = {category: sorted(lengths)[len(lengths) // 2] for category, lengths in (history or {}).items() if lengths}
+
+    def estimate(self, data, max_tokens):
+        predicted = self.history_median.get(problem_category(data, self.metadata))
+        if predicted is None:
+            files = expected_output_files(data, self.context)
+            inputs = self.context.get(data["id"], {}).get("input", {})
+            predicted = max(
+                sum(FILE_TYPE_TOKENS.get(os.path.splitext(f)[1], DEFAULT_FILE_TOKENS) for f in files),
+                sum(approx_tokens(text) for text in inputs.values() if isinstance(text, str))
+            ) or max_tokens
+        return min(predicted, max_tokens)
+
+class TokenBudgeter:
+    def __init__(self, max_tokens, min_tokens=256, context=None, metadata=None, history=None):
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.context = context or {}
+        self.metadata = metadata or {}
+        self.history_budget = {}
+        for category, lengths in (history or {}).items():
+            ordered = sorted(lengths)
+            self.history_budget[category] = int(ordered[int(0.95 * (len(ordered) - 1))] * 1.25)
+        # Running totals rather than one entry per request, so streaming runs stay in bounded memory
+        self.requests = 0
+        self.budget_total = 0
+
+    def budget(self, data):
+        files = expected_output_files(data, self.context)
+        file_budget = sum(FILE_TYPE_TOKENS.get(os.path.splitext(f)[1], DEFAULT_FILE_TOKENS) for f in files) or self.max_tokens
+        # A modified file is roughly as long as the original it was given
+        inputs = self.context.get(data["id"], {}).get("input", {})
+        input_budget = int(sum(approx_tokens(text) for text in inputs.values() if isinstance(text, str)) * 1.25)
+        history_budget = self.history_budget.get(problem_category(data, self.metadata), 0)
+        return max(self.min_tokens, min(self.max_tokens, max(file_budget, input_budget, history_budget)))
+
+    def record(self, budget, requests=1):
+        self.requests += requests
+        self.budget_total += budget * requests
+
+    def report(self, kv_bytes_per_token=None, slots=None):
+        if not self.requests:
+            return
+        saved = self.max_tokens * self.requests - self.budget_total
+        print(f"Adaptive max_tokens: mean budget {self.budget_total / self.requests:.0f} tokens (cap {self.max_tokens}), "
+              f"{saved} decode tokens fewer reserved ({saved / (self.max_tokens * self.requests):.1%})")
+        if kv_bytes_per_token:
+            # KV cache is held per running sequence, so the saving is per sequence and per batch of concurrent ones,
+            # not the run-wide token total
+            per_sequence = saved / self.requests * kv_bytes_per_token
+            line = f"Worst-case KV cache saved: {per_sequence / 1024 ** 2:.1f} MiB per sequence"
+            if slots:
+                line += f", {per_sequence * slots / 1024 ** 3:.2f} GiB across {slots} concurrent sequences"
+            print(line)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import queue
+import threading
+import traceback
+import multiprocessing
+from collections import deque
+from inference_backends import GenerationBackend
+
+# Requests each replica keeps inside its engine; the rest stay with the coordinator where idle replicas can steal them
+REPLICA_WINDOW = 512
+# Requests handed to a replica per ask
+CHUNK_SIZE = 32
+
+class ReplicaFeed:
+    # Request iterator inside a worker: takes whatever the coordinator has sent and asks for
+    # more once it runs dry, without blocking the engine while the answer is on its way
+    def __init__(self, replica, tasks, messages):
+        self.replica = replica
+        self.tasks = tasks
+        self.messages = messages
+        self.buffer = deque()
+        self.asked = False
+        self.stopping = False
+
+    def __iter__(self):
+        return self
+
+    def take(self, batch):
+        if batch is None:
+            self.stopping = True
+        else:
+            self.buffer.extend(batch)
+            self.asked = False
+
+    def __next__(self):
+        while not self.buffer and not self.stopping:
+            try:
+                self.take(self.tasks.get_nowait()[0])
+            except queue.Empty:
+                break
+        if self.buffer:
+            return self.buffer.popleft()
+        if not self.asked and not self.stopping:
+            self.messages.put(("want", self.replica, None))
+            self.asked = True
+        raise StopIteration
+
+def replica_worker(replica, devices, factory, speculative, tasks, messages, cancel_event):
+    try:
+        if devices is not None:
+            os.environ["CUDA_VISIBLE_DEVICES"] = ",".join(devices)
+        backend = factory()
+        threading.Thread(target=lambda: cancel_event.wait() and backend.cancel(), daemon=True).start()
+        start = time.perf_counter()
+        backend.load(speculative)
+        messages.put(("loaded", replica, time.perf_counter() - start))
+
+        feed = ReplicaFeed(replica, tasks, messages)
+        window, stop_check = REPLICA_WINDOW, None
+        while not feed.stopping:
+            for result in backend.generate(feed, window, stop_check):
+                messages.put(("result", replica, result))
+            messages.put(("counters", replica, backend.counters()))
+            if feed.stopping:
+                break
+            # Idle until the coordinator has more work for this replica
+            batch, window, stop_check = tasks.get()
+            feed.take(batch)
+            window = window or REPLICA_WINDOW
+
+        sys.stdout.write(f"--- Replica {replica} ---\n")
+        sys.stdout.flush()
+        backend.report()
+        sys.stdout.flush()
+        backend.close()
+        messages.put(("closed", replica, None))
+    except BaseException:
+        messages.put(("error", replica, traceback.format_exc()))
+
+class DataParallelBackend(GenerationBackend):
+    # K engine replicas in worker processes. Requests are sharded into contiguous blocks, which keeps
+    # prefix groups on one replica's prefix cache, and a replica that runs out of its own block steals
+    # the second half of the largest remaining one.
+    name = "data-parallel"
+
+    def __init__(self, factory, replicas, devices_per_replica=1):
+        self.factory = factory
+        self.replicas = replicas
+        self.devices_per_replica = devices_per_replica
+        self.local = factory()
+        self.model_name = self.local.model_name
+        self.prefix_caching = self.local.prefix_caching
+        self.processes = []
+        self.hungry = set()
+        self.replica_counters = {}
+        self.stats = [{"requests": 0, "samples": 0, "tokens": 0, "busy": 0.0, "load_time": None} for _ in range(replicas)]
+
+    @property
+    def tokenizer_name(self):
+        return self.local.tokenizer_name
+
+    def tokenize(self, prompts):
+        return self.local.tokenize(prompts)
+
+    def context_length(self):
+        return self.local.context_length()
+
+    def replica_devices(self, replica):
+        visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+        devices = visible.split(",") if visible else [str(i) for i in range(self.replicas * self.devices_per_replica)]
+        return devices[replica * self.devices_per_replica:(replica + 1) * self.devices_per_replica]
+
+    def load(self, speculative=False):
+        print(f"Starting {self.replicas} data-parallel replicas with {self.devices_per_replica} device(s) each")
+        # CUDA cannot be initialised in a forked child, so every replica starts a fresh interpreter
+        context = multiprocessing.get_context("spawn")
+        self.messages = context.Queue()
+        self.tasks = [context.Queue() for _ in range(self.replicas)]
+        self.cancel_event = context.Event()
+        for replica in range(self.replicas):
+            process = context.Process(
+                target=replica_worker,
+                args=(replica, self.replica_devices(replica), self.factory, speculative, self.tasks[replica], self.messages, self.cancel_event)
+            )
+            process.start()
+            self.processes.append(process)
+
+        loaded = 0
+        while loaded < self.replicas:
+            kind, replica, payload = self.receive()
+            if kind == "loaded":
+                self.stats[replica]["load_time"] = payload
+                loaded += 1
+        self.load_time = max(s["load_time"] for s in self.stats)
+
+    def receive(self, timeout=None):
+        try:
+            kind, replica, payload = self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None, None, None
+        if kind == "error":
+            raise RuntimeError(f"Replica {replica} failed:\n{payload}")
+        if kind == "want":
+            self.hungry.add(replica)
+        elif kind == "counters":
+            self.replica_counters[replica] = payload
+        return kind, replica, payload
+
+    def take(self, replica, shards, shared):
+        if shared:
+            return [shared.popleft() for _ in range(min(CHUNK_SIZE, len(shared)))]
+        own = shards[replica]
+        if own:
+            return [own.popleft() for _ in range(min(CHUNK_SIZE, len(own)))]
+        victim = max(shards, key=len)
+        stolen = min(CHUNK_SIZE, (len(victim) + 1) // 2)
+        return [victim.pop() for _ in range(stolen)][::-1]
+
+    def generate(self, requests, window=None, stop_check=None):
+        requests = iter(requests)
+        shards = [deque() for _ in range(self.replicas)]
+        shared = deque()
+        if window is None:
+            pulled = list(requests)
+            size = -(-len(pulled) // self.replicas) if pulled else 0
+            for replica in range(self.replicas):
+                shards[replica].extend(pulled[replica * size:(replica + 1) * size])
+        outstanding = {}
+        running = [0] * self.replicas
+        busy_since = {}
+        while True:
+            # Top up from the caller; this also picks up resubmitted requests
+            while window is None or len(shared) + len(outstanding) < window * self.replicas:
+                request = next(requests, None)
+                if request is None:
+                    break
+                shared.append(request)
+
+            for replica in sorted(self.hungry):
+                batch = self.take(replica, shards, shared)
+                if not batch:
+                    break
+                self.hungry.discard(replica)
+                busy_since.setdefault(replica, time.perf_counter())
+                for request in batch:
+                    outstanding[request.request_id] = replica
+                running[replica] += len(batch)
+                self.tasks[replica].put((batch, window, stop_check))
+
+            if self.cancelled or (not outstanding and not shared and not any(shards)):
+                break
+
+            kind, replica, result = self.receive(timeout=0.5)
+            # Results of requests given up on by an earlier, cancelled call are dropped
+            if kind != "result" or result.request.request_id not in outstanding:
+                continue
+            del outstanding[result.request.request_id]
+            running[replica] -= 1
+            stats = self.stats[replica]
+            stats["requests"] += 1
+            stats["samples"] += len(result.completions)
+            stats["tokens"] += sum(c.num_tokens for c in result.completions)
+            if not running[replica]:
+                stats["busy"] += time.perf_counter() - busy_since.pop(replica)
+            yield result
+
+        for replica, start in busy_since.items():
+            self.stats[replica]["busy"] += time.perf_counter() - start
+
+    def cancel(self):
+        self.cancelled = True
+        if self.processes:
+            self.cancel_event.set()
+
+    def warm_prefixes(self, prefixes):
+        # Every replica keeps its own prefix cache; requests land on one replica each, so warming is left to them
+        pass
+
+    def counters(self):
+        total = {}
+        for counters in self.replica_counters.values():
+            for name, value in counters.items():
+                total[name] = total.get(name, 0) + value
+        return total
+
+    def report(self):
+        for replica, stats in enumerate(self.stats):
+            throughput = stats["tokens"] / stats["busy"] if stats["busy"] else 0.0
+            print(f"Replica {replica}: {stats['requests']} requests, {stats['samples']} samples, "
+                  f"{stats['tokens']} completion tokens, {throughput:.1f} tokens/s (loaded in {stats['load_time']:.1f}s)")
+
+    def close(self):
+        for tasks in self.tasks:
+            tasks.put((None, None, None))
+        closed = 0
+        while closed < self.replicas:
+            kind, _, _ = self.receive()
+            closed += kind == "closed"
+        for process in self.processes:
+            process.join()
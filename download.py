@@ -1,31 +1,215 @@
 #!/usr/bin/env python3
 
 import os
-from datasets import load_dataset
+import json
+import shutil
+import hashlib
+import argparse
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ID = "nvidia/cvdp-benchmark-dataset"
+CONFIG = "cvdp_nonagentic_code_generation_no_commercial"
+CHUNK = 1 << 20
 
 def download_cvdp_dataset():
     """CVDPデータセットをダウンロード"""
-    
+
     # HF_HOME環境変数をチェック
     hf_home = os.environ.get('HF_HOME')
     if not hf_home:
         print("❌ HF_HOME環境変数が設定されていません")
         return None
-    
+
     print(f"🤗 CVDPデータセットをダウンロード中...")
     print(f"キャッシュ先: {hf_home}")
-    
+
     try:
+        from datasets import load_dataset
+
         # データセットをダウンロード
-        dataset = load_dataset("nvidia/cvdp-benchmark-dataset", "cvdp_nonagentic_code_generation_no_commercial")
-        
+        dataset = load_dataset(REPO_ID, CONFIG)
+
         print("✅ ダウンロード完了!")
         return dataset
-        
+
     except Exception as e:
         print(f"❌ エラー: {e}")
         print("認証が必要な場合は 'huggingface-cli login' を実行してください")
         return None
 
+# ミラーとキャッシュはどちらもHugging Faceのキャッシュと同じ構成:
+#   refs/<revision>            コミットハッシュ
+#   blobs/<sha256>             内容アドレスのファイル本体
+#   snapshots/<commit>/<path>  blobsへのシンボリックリンク
+#   manifests/<commit>.json    {"files": {<path>: {"sha256", "size"}}} (ミラー用に追加)
+
+def repo_cache_dir(hf_home):
+    return os.path.join(hf_home, "hub", "datasets--" + REPO_ID.replace("/", "--"))
+
+def mirror_url(mirror, path):
+    # ローカルディレクトリ、file:// または http(s):// のミラー上のパス
+    if "://" not in mirror:
+        mirror = "file://" + urllib.request.pathname2url(os.path.abspath(mirror))
+    return mirror.rstrip("/") + "/" + urllib.parse.quote(path)
+
+def fetch_bytes(mirror, path):
+    with urllib.request.urlopen(mirror_url(mirror, path), timeout=60) as response:
+        return response.read()
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def fetch_blob(mirror, blobs_dir, sha256, size):
+    """blobを1つ取得してチェックサムを検証 (中断した .incomplete から再開)"""
+    target = os.path.join(blobs_dir, sha256)
+    if os.path.exists(target):
+        return False
+    partial = target + ".incomplete"
+    offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+    if offset > size:
+        offset = 0
+
+    request = urllib.request.Request(mirror_url(mirror, f"blobs/{sha256}"))
+    if offset and request.type in ("http", "https"):
+        request.add_header("Range", f"bytes={offset}-")
+    with urllib.request.urlopen(request, timeout=60) as response:
+        if offset and request.type in ("http", "https") and response.status != 206:
+            # Rangeに対応していないサーバーでは最初から取り直す
+            offset = 0
+        elif offset and request.type == "file":
+            response.seek(offset)
+        with open(partial, 'r+b' if offset else 'wb') as f:
+            f.seek(offset)
+            f.truncate()
+            shutil.copyfileobj(response, f, CHUNK)
+
+    actual = file_sha256(partial)
+    if actual != sha256:
+        os.remove(partial)
+        raise ValueError(f"チェックサム不一致: blobs/{sha256} ({actual})")
+    os.replace(partial, target)
+    return True
+
+def link_snapshot(cache_dir, commit, files):
+    for path, entry in files.items():
+        link = os.path.join(cache_dir, "snapshots", commit, path)
+        os.makedirs(os.path.dirname(link), exist_ok=True)
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.path.relpath(os.path.join(cache_dir, "blobs", entry["sha256"]), os.path.dirname(link)), link)
+
+def cached_manifest(cache_dir, revision):
+    """要求されたリビジョンがキャッシュに揃っていればそのマニフェストを返す"""
+    ref = os.path.join(cache_dir, "refs", revision)
+    commit = open(ref).read().strip() if os.path.isfile(ref) else revision
+    path = os.path.join(cache_dir, "manifests", f"{commit}.json")
+    if not os.path.isfile(path):
+        return None, None
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    blobs = os.path.join(cache_dir, "blobs")
+    for entry in manifest["files"].values():
+        blob = os.path.join(blobs, entry["sha256"])
+        if not os.path.exists(blob) or os.path.getsize(blob) != entry["size"]:
+            return None, None
+    return commit, manifest
+
+def download_from_mirror(mirror, revision="main", workers=8):
+    """ミラーからHF_HOMEのキャッシュへ並列ダウンロード"""
+    hf_home = os.environ.get('HF_HOME')
+    if not hf_home:
+        print("❌ HF_HOME環境変数が設定されていません")
+        return None
+    cache_dir = repo_cache_dir(hf_home)
+
+    commit, manifest = cached_manifest(cache_dir, revision)
+    if manifest:
+        link_snapshot(cache_dir, commit, manifest["files"])
+        print(f"✅ リビジョン {revision} ({commit[:12]}) はキャッシュ済みです (ネットワーク不使用)")
+        return os.path.join(cache_dir, "snapshots", commit)
+
+    print(f"📦 ミラーから取得中: {mirror} (リビジョン {revision})")
+    try:
+        commit = fetch_bytes(mirror, f"refs/{revision}").decode().strip()
+    except (OSError, ValueError):
+        # refsがなければコミットハッシュの指定とみなす
+        commit = revision
+    manifest = json.loads(fetch_bytes(mirror, f"manifests/{commit}.json"))
+    files = manifest["files"]
+
+    blobs_dir = os.path.join(cache_dir, "blobs")
+    os.makedirs(blobs_dir, exist_ok=True)
+    blobs = {entry["sha256"]: entry["size"] for entry in files.values()}
+    with ThreadPoolExecutor(max(1, workers)) as executor:
+        fetched = sum(executor.map(lambda item: fetch_blob(mirror, blobs_dir, *item), blobs.items()))
+    print(f"取得 {fetched} 件 / キャッシュ済み {len(blobs) - fetched} 件 (全 {len(files)} ファイル)")
+
+    link_snapshot(cache_dir, commit, files)
+    os.makedirs(os.path.join(cache_dir, "manifests"), exist_ok=True)
+    with open(os.path.join(cache_dir, "manifests", f"{commit}.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    if commit != revision:
+        os.makedirs(os.path.join(cache_dir, "refs"), exist_ok=True)
+        with open(os.path.join(cache_dir, "refs", revision), 'w') as f:
+            f.write(commit)
+    print(f"✅ ダウンロード完了! {os.path.join(cache_dir, 'snapshots', commit)}")
+    return os.path.join(cache_dir, "snapshots", commit)
+
+def export_mirror(mirror_dir):
+    """オンライン環境のキャッシュからエアギャップ用のミラーを作成"""
+    hf_home = os.environ.get('HF_HOME')
+    if not hf_home:
+        print("❌ HF_HOME環境変数が設定されていません")
+        return None
+    cache_dir = repo_cache_dir(hf_home)
+    snapshots = os.path.join(cache_dir, "snapshots")
+    if not os.path.isdir(snapshots):
+        print(f"❌ キャッシュにデータセットがありません: {cache_dir}")
+        return None
+
+    os.makedirs(os.path.join(mirror_dir, "blobs"), exist_ok=True)
+    os.makedirs(os.path.join(mirror_dir, "manifests"), exist_ok=True)
+    for commit in sorted(os.listdir(snapshots)):
+        files = {}
+        root = os.path.join(snapshots, commit)
+        for dirpath, _, names in os.walk(root):
+            for name in names:
+                source = os.path.realpath(os.path.join(dirpath, name))
+                sha256 = file_sha256(source)
+                files[os.path.relpath(os.path.join(dirpath, name), root)] = {"sha256": sha256, "size": os.path.getsize(source)}
+                target = os.path.join(mirror_dir, "blobs", sha256)
+                if not os.path.exists(target):
+                    shutil.copyfile(source, target)
+        with open(os.path.join(mirror_dir, "manifests", f"{commit}.json"), 'w', encoding='utf-8') as f:
+            json.dump({"files": files}, f, indent=2)
+        print(f"リビジョン {commit[:12]}: {len(files)} ファイル")
+    if os.path.isdir(os.path.join(cache_dir, "refs")):
+        shutil.copytree(os.path.join(cache_dir, "refs"), os.path.join(mirror_dir, "refs"), dirs_exist_ok=True)
+    print(f"✅ ミラー作成完了: {mirror_dir}")
+    return mirror_dir
+
 if __name__ == "__main__":
-    download_cvdp_dataset()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="CVDPデータセットをHugging Faceまたはローカルミラーから取得")
+    parser.add_argument("--mirror", default=None, help="ミラー (ディレクトリ、file:// または http://localhost:PORT)")
+    parser.add_argument("--revision", default="main", help="取得するリビジョン (refの名前またはコミットハッシュ)")
+    parser.add_argument("--workers", type=int, default=8, help="並列ダウンロード数")
+    parser.add_argument("--export-mirror", default=None, help="HF_HOMEのキャッシュからミラーを作成するディレクトリ")
+    args = parser.parse_args()
+
+    if args.export_mirror:
+        export_mirror(args.export_mirror)
+    elif args.mirror:
+        try:
+            download_from_mirror(args.mirror, args.revision, args.workers)
+        except (OSError, ValueError) as e:
+            print(f"❌ エラー: {e}")
+            print("ミラーを再取得すると .incomplete から再開します")
+            raise SystemExit(1)
+    else:
+        download_cvdp_dataset()
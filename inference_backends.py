@@ -0,0 +1,561 @@
+#!/usr/bin/env python3
+import re
+import json
+import time
+import zlib
+import math
+import queue
+import random
+import asyncio
+import hashlib
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from response_io import read_responses
+
+@dataclass
+class GenerationRequest:
+    request_id: str
+    prompt: str
+    params: dict
+    prompt_id: str = None
+    expected_files: list = None
+    guided_regex: str = None
+
+@dataclass
+class Completion:
+    text: str
+    num_tokens: int = 0
+    finish_reason: str = None
+
+@dataclass
+class GenerationResult:
+    request: GenerationRequest
+    completions: list = field(default_factory=list)
+    prompt_tokens: int = 0
+    ttft: float = None
+    latency: float = None
+
+class GenerationBackend:
+    name = "base"
+    model_name = None
+    prefix_caching = False
+    loaded = False
+    load_time = None
+    tokenizer = None
+    cancelled = False
+
+    def load(self, speculative=False):
+        pass
+
+    def generate(self, requests, window=None, stop_check=None):
+        # Yields a GenerationResult for each request as soon as all of its samples have finished.
+        # requests may be a lazy iterator; with a window, at most that many are admitted at once.
+        # It is polled again after running dry, so the caller can add requests while results arrive.
+        # stop_check(request, text) may return an offset at which a single-sample request is cut short.
+        raise NotImplementedError
+
+    def warm_prefixes(self, prefixes):
+        requests = [
+            GenerationRequest(f"warm-{i}", prefix, {"n": 1, "max_tokens": 1})
+            for i, prefix in enumerate(prefixes)
+        ]
+        for _ in self.generate(requests):
+            pass
+
+    @property
+    def tokenizer_name(self):
+        return self.model_name
+
+    def tokenize(self, prompts):
+        # Uses the model's own tokenizer, which is available without loading the engine
+        if self.tokenizer is None:
+            from transformers import AutoTokenizer
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, trust_remote_code=True)
+        return self.tokenizer(prompts)["input_ids"]
+
+    def context_length(self):
+        from transformers import AutoConfig
+        config = AutoConfig.from_pretrained(self.model_name, trust_remote_code=True)
+        config = getattr(config, "text_config", None) or config
+        return getattr(config, "max_position_embeddings", None)
+
+    def kv_cache_bytes_per_token(self):
+        return None
+
+    def counters(self):
+        return {}
+
+    def report(self):
+        pass
+
+    def cancel(self):
+        # May be called from another thread; generate() aborts what is running and returns,
+        # and later calls return right away
+        self.cancelled = True
+
+    def close(self):
+        pass
+
+class VLLMBackend(GenerationBackend):
+    name = "vllm"
+
+    def __init__(self, model_name, tensor_parallel_size=1, gpu_memory_utilization=0.9, enable_prefix_caching=True, num_speculative_tokens=0, max_model_len=None):
+        self.model_name = model_name
+        self.max_model_len = max_model_len
+        self.tensor_parallel_size = tensor_parallel_size
+        self.gpu_memory_utilization = gpu_memory_utilization
+        self.prefix_caching = enable_prefix_caching
+        self.num_speculative_tokens = num_speculative_tokens
+        self.speculative = False
+        self.llm = None
+
+    def load(self, speculative=False):
+        from vllm import LLM
+
+        print(f"Loading vLLM model: {self.model_name}")
+        print(f"Tensor parallel size: {self.tensor_parallel_size}")
+        print(f"GPU memory utilization: {self.gpu_memory_utilization}")
+        print(f"Prefix caching: {self.prefix_caching}")
+
+        # vLLM configures speculative decoding per engine, not per request
+        extra = {}
+        if self.max_model_len:
+            extra["max_model_len"] = self.max_model_len
+        self.speculative = speculative and self.num_speculative_tokens > 0
+        if self.speculative:
+            print(f"Speculative decoding: n-gram prompt lookup, {self.num_speculative_tokens} draft tokens")
+            extra["speculative_config"] = {
+                "method": "ngram",
+                "num_speculative_tokens": self.num_speculative_tokens,
+                "prompt_lookup_max": 4,
+                "prompt_lookup_min": 2
+            }
+
+        self.llm = LLM(
+            model=self.model_name,
+            tensor_parallel_size=self.tensor_parallel_size,
+            gpu_memory_utilization=self.gpu_memory_utilization,
+            trust_remote_code=True,
+            enable_prefix_caching=self.prefix_caching,
+            disable_log_stats=False,
+            **extra
+        )
+
+    def generate(self, requests, window=None, stop_check=None):
+        from vllm import SamplingParams
+
+        # Drive the engine step by step so finished requests can be handed out immediately
+        engine = self.llm.llm_engine
+        requests = iter(requests)
+        submitted = {}
+        submit_time = {}
+        first_token = {}
+        checked = {}
+
+        def finish(output, completions):
+            request_id = output.request_id
+            now = time.perf_counter()
+            checked.pop(request_id, None)
+            start = submit_time.pop(request_id)
+            return GenerationResult(
+                submitted.pop(request_id),
+                completions,
+                len(output.prompt_token_ids or []),
+                first_token.pop(request_id, now) - start,
+                now - start
+            )
+
+        while True:
+            if self.cancelled:
+                if submitted:
+                    engine.abort_request(list(submitted))
+                return
+            while window is None or len(submitted) < window:
+                request = next(requests, None)
+                if request is None:
+                    break
+                submitted[request.request_id] = request
+                submit_time[request.request_id] = time.perf_counter()
+                engine.add_request(request.request_id, request.prompt, SamplingParams(**request.params, **self.guided_params(request)))
+            if not submitted:
+                return
+
+            for output in engine.step():
+                if output.request_id not in submitted:
+                    continue
+                if output.request_id not in first_token and any(o.token_ids for o in output.outputs):
+                    first_token[output.request_id] = time.perf_counter()
+                if output.finished:
+                    yield finish(output, [Completion(o.text, len(o.token_ids), o.finish_reason) for o in output.outputs])
+                elif stop_check and len(output.outputs) == 1:
+                    # Only rescan when the new text could have closed a code fence
+                    sample = output.outputs[0]
+                    if "`" in sample.text[max(0, checked.get(output.request_id, 0) - 3):]:
+                        cut = stop_check(submitted[output.request_id], sample.text)
+                        if cut is not None:
+                            engine.abort_request([output.request_id])
+                            yield finish(output, [Completion(sample.text[:cut], len(sample.token_ids), "early_stop")])
+                            continue
+                    checked[output.request_id] = len(sample.text)
+
+    def guided_params(self, request):
+        if not request.guided_regex:
+            return {}
+        # Newer vLLM releases renamed guided decoding to structured outputs
+        try:
+            from vllm.sampling_params import GuidedDecodingParams
+            return {"guided_decoding": GuidedDecodingParams(regex=request.guided_regex)}
+        except ImportError:
+            from vllm.sampling_params import StructuredOutputsParams
+            return {"structured_outputs": StructuredOutputsParams(regex=request.guided_regex)}
+
+    def kv_cache_bytes_per_token(self):
+        try:
+            model_config = self.llm.llm_engine.model_config
+            hf_config = model_config.hf_text_config
+            num_heads = hf_config.num_attention_heads
+            kv_heads = getattr(hf_config, "num_key_value_heads", None) or num_heads
+            head_dim = getattr(hf_config, "head_dim", None) or hf_config.hidden_size // num_heads
+            # Keys and values for every layer
+            return 2 * hf_config.num_hidden_layers * kv_heads * head_dim * model_config.dtype.itemsize
+        except AttributeError:
+            return None
+
+    def engine_counters(self):
+        # LLM.get_metrics() is only available on the V1 engine with stats logging enabled
+        try:
+            metrics = self.llm.get_metrics()
+        except (AttributeError, AssertionError):
+            return {}
+        return {m.name: m.value for m in metrics if isinstance(getattr(m, "value", None), (int, float))}
+
+    def counters(self):
+        return self.engine_counters()
+
+    def report(self):
+        counters = self.engine_counters()
+        if self.prefix_caching:
+            queries = counters.get("vllm:prefix_cache_queries", 0)
+            hits = counters.get("vllm:prefix_cache_hits", 0)
+            if queries:
+                print(f"Prefix cache hit rate: {hits / queries:.1%} ({int(hits)} of {int(queries)} prompt tokens)")
+            else:
+                print("Prefix cache hit rate: not reported by this vLLM version")
+        if self.speculative:
+            drafted = counters.get("vllm:spec_decode_num_draft_tokens", 0)
+            accepted = counters.get("vllm:spec_decode_num_accepted_tokens", 0)
+            drafts = counters.get("vllm:spec_decode_num_drafts", 0)
+            if drafted:
+                print(f"Speculative decoding acceptance rate: {accepted / drafted:.1%} ({int(accepted)} of {int(drafted)} draft tokens)")
+                if drafts:
+                    print(f"Mean accepted tokens per step: {1 + accepted / drafts:.2f}")
+            else:
+                print("Speculative decoding acceptance rate: not reported by this vLLM version")
+
+class LatencySketch:
+    # Running summary of a stream of values in bounded memory: quantiles come from log-spaced
+    # buckets, so they are within 2% of the exact value however many values were added
+    GROWTH = 1.02
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = None
+        self.buckets = Counter()
+
+    def add(self, value):
+        if value is None:
+            return
+        self.count += 1
+        self.total += value
+        self.max = value if self.max is None else max(self.max, value)
+        self.buckets[math.floor(math.log(max(value, 1e-9), self.GROWTH))] += 1
+
+    def quantile(self, q):
+        rank = min(self.count - 1, int(q * self.count))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen > rank:
+                return min(self.GROWTH ** (bucket + 1), self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {}
+        return {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max
+        }
+
+class OpenAIBackend(GenerationBackend):
+    name = "openai"
+
+    def __init__(self, endpoint, model_name, max_in_flight=64, max_retries=5, timeout=600, backoff=0.5):
+        self.endpoint = endpoint.rstrip("/")
+        self.model_name = model_name
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.latencies = LatencySketch()
+        self.retries = 0
+        self.run_task = None
+
+    def load(self, speculative=False):
+        print(f"Using OpenAI-compatible server at {self.endpoint} (up to {self.max_in_flight} requests in flight)")
+
+    def generate(self, requests, window=None, stop_check=None):
+        # The asyncio client runs on its own thread and hands finished requests back through a queue
+        results = queue.Queue()
+        progress = {"put": 0, "handled": 0}
+        max_in_flight = min(self.max_in_flight, window or self.max_in_flight)
+        thread = threading.Thread(target=lambda: asyncio.run(self._run(iter(requests), results, progress, max_in_flight, stop_check)), daemon=True)
+        thread.start()
+        while True:
+            item = results.get()
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                thread.join()
+                raise item
+            yield item
+            # The caller has dealt with the result and may have queued further requests
+            progress["handled"] += 1
+        thread.join()
+
+    async def _run(self, requests, results, progress, max_in_flight, stop_check):
+        import aiohttp
+
+        # The connector pool keeps one keep-alive connection per in-flight slot
+        connector = aiohttp.TCPConnector(limit=max_in_flight, keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        in_flight = asyncio.Semaphore(max_in_flight)
+        pending = set()
+        self.run_task = asyncio.current_task()
+        self.loop = asyncio.get_running_loop()
+        try:
+            if self.cancelled:
+                return
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                while True:
+                    request = next(requests, None)
+                    if request is not None:
+                        await in_flight.acquire()
+                        pending.add(asyncio.create_task(self._complete(session, request, in_flight, stop_check)))
+                        pending = await self._drain(pending, results, progress, 0)
+                    elif pending:
+                        # Poll again shortly, the caller may add requests for results it has received
+                        pending = await self._drain(pending, results, progress, 0.05)
+                    elif progress["handled"] < progress["put"]:
+                        await asyncio.sleep(0.005)
+                    else:
+                        break
+        except asyncio.CancelledError:
+            # Closing the streams makes the server abort the requests
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        except BaseException as e:
+            for task in pending:
+                task.cancel()
+            results.put(e)
+        finally:
+            self.run_task = None
+            results.put(None)
+
+    def cancel(self):
+        self.cancelled = True
+        try:
+            if self.run_task:
+                self.loop.call_soon_threadsafe(self.run_task.cancel)
+        except RuntimeError:
+            # The event loop has already finished
+            pass
+
+    async def _drain(self, pending, results, progress, timeout):
+        done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            progress["put"] += 1
+            results.put(task.result())
+        return pending
+
+    async def _complete(self, session, request, in_flight, stop_check):
+        import aiohttp
+
+        # Responses are always streamed: that gives time to first token, and for single-sample
+        # requests dropping the connection after an early stop makes the server abort the request
+        payload = dict(request.params, model=self.model_name, prompt=request.prompt, stream=True, stream_options={"include_usage": True})
+        if request.guided_regex:
+            # vLLM's extension to the completions API
+            payload["guided_regex"] = request.guided_regex
+        if payload.get("n", 1) != 1:
+            stop_check = None
+        try:
+            for attempt in range(self.max_retries + 1):
+                start = time.perf_counter()
+                try:
+                    async with session.post(f"{self.endpoint}/v1/completions", json=payload) as response:
+                        response.raise_for_status()
+                        result = await self._read_stream(response, request, stop_check, start)
+                    break
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    # Client errors other than rate limiting will not succeed on a retry
+                    status = getattr(e, "status", None)
+                    if attempt == self.max_retries or (status and status < 500 and status != 429):
+                        raise
+                    self.retries += 1
+                    await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.0))
+            self.latencies.add(result.latency)
+        finally:
+            in_flight.release()
+        return result
+
+    async def _read_stream(self, response, request, stop_check, start):
+        n = request.params.get("n", 1)
+        texts, chunks, finish_reasons = [""] * n, [0] * n, [None] * n
+        result = GenerationResult(request)
+        async for line in response.content:
+            line = line.decode('utf-8').strip()
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            result.prompt_tokens = (chunk.get("usage") or {}).get("prompt_tokens", result.prompt_tokens)
+            for choice in chunk.get("choices", []):
+                index = choice.get("index", 0)
+                piece = choice.get("text", "")
+                if piece and result.ttft is None:
+                    result.ttft = time.perf_counter() - start
+                texts[index] += piece
+                chunks[index] += 1
+                finish_reasons[index] = choice.get("finish_reason") or finish_reasons[index]
+                if stop_check and "`" in piece:
+                    cut = stop_check(request, texts[index])
+                    if cut is not None:
+                        result.completions = [Completion(texts[index][:cut], chunks[index], "early_stop")]
+                        result.latency = time.perf_counter() - start
+                        return result
+        # vLLM streams one chunk per generated token
+        result.completions = [Completion(t, c, f) for t, c, f in zip(texts, chunks, finish_reasons)]
+        result.latency = time.perf_counter() - start
+        return result
+
+    def report(self):
+        stats = self.latencies.summary()
+        if stats:
+            print(f"HTTP requests: {stats['count']}, retries: {self.retries}")
+            print(f"Request latency: mean {stats['mean']:.2f}s, p50 {stats['p50']:.2f}s, p95 {stats['p95']:.2f}s, max {stats['max']:.2f}s")
+
+# The mock engine treats every whitespace-delimited word as one token
+def mock_tokens(text):
+    return re.findall(r"\s*\S+", text)
+
+def count_tokens(text):
+    return len(mock_tokens(text))
+
+def truncate_tokens(text, max_tokens):
+    tokens = mock_tokens(text)
+    if len(tokens) <= max_tokens:
+        return text, "stop"
+    return "".join(tokens[:max_tokens]), "length"
+
+def synthetic_completion(prompt, seed):
+    # Deterministic pseudo-RTL whose length depends only on the prompt and the seed
+    digest = hashlib.sha256(f"{seed}:{prompt}".encode('utf-8')).hexdigest()
+    rng = random.Random(digest)
+    name = f"mock_{digest[:8]}"
+    lines = [f"module {name} (", "    input clk,", "    input rst_n,", "    output reg [7:0] q", ");"]
+    for i in range(rng.randint(4, 64)):
+        lines.append(f"    // step {i}: q <= q ^ 8'h{rng.randrange(256):02x};")
+    lines.append("endmodule")
+    # Models tend to keep explaining after the code block
+    epilogue = " ".join(["This module implements the requested behaviour."] * rng.randint(0, 16))
+    return "```systemverilog\n" + "\n".join(lines) + "\n```\n" + epilogue
+
+class MockBackend(GenerationBackend):
+    name = "mock"
+
+    def __init__(self, replay_file=None, token_latency=0.0, max_batch=256):
+        self.token_latency = token_latency
+        self.max_batch = max_batch
+        self.replay = {}
+        if replay_file:
+            for record in read_responses(replay_file):
+                self.replay.setdefault(record["id"], []).append(record["completion"])
+
+    tokenizer_name = "mock"
+
+    def tokenize(self, prompts):
+        return [[zlib.crc32(token.encode('utf-8')) for token in mock_tokens(prompt)] for prompt in prompts]
+
+    def context_length(self):
+        return None
+
+    def load(self, speculative=False):
+        print(f"Using mock backend ({len(self.replay)} replayed ids, {self.token_latency * 1000:.1f} ms/token)")
+
+    def warm_prefixes(self, prefixes):
+        pass
+
+    def completion(self, request, index):
+        seed = request.params.get("seed") or 0
+        canned = self.replay.get(request.prompt_id)
+        if canned:
+            text = canned[(seed + index) % len(canned)]
+        else:
+            text = synthetic_completion(request.prompt, seed + index)
+        text, finish_reason = truncate_tokens(text, request.params.get("max_tokens", 2048))
+        return Completion(text, count_tokens(text), finish_reason)
+
+    def generate(self, requests, window=None, stop_check=None):
+        # Emulates continuous batching: every running request advances one token per step
+        requests = iter(requests)
+        running = []
+        max_running = min(self.max_batch, window or self.max_batch)
+        while True:
+            if self.cancelled:
+                return
+            while len(running) < max_running:
+                request = next(requests, None)
+                if request is None:
+                    break
+                completions = [self.completion(request, i) for i in range(request.params.get("n", 1))]
+                running.append({
+                    "request": request,
+                    "submitted": time.perf_counter(),
+                    "completions": completions,
+                    "tokens": mock_tokens(completions[0].text) if len(completions) == 1 else None,
+                    "steps": max(c.num_tokens for c in completions),
+                    "step": 0
+                })
+            if not running:
+                return
+
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            now = time.perf_counter()
+            still_running = []
+            for entry in running:
+                entry["step"] += 1
+                entry.setdefault("ttft", now - entry["submitted"])
+                request = entry["request"]
+                completions = None
+                if entry["step"] >= entry["steps"]:
+                    completions = entry["completions"]
+                elif stop_check and entry["tokens"] and "`" in entry["tokens"][entry["step"] - 1]:
+                    text = "".join(entry["tokens"][:entry["step"]])
+                    cut = stop_check(request, text)
+                    if cut is not None:
+                        completions = [Completion(text[:cut], entry["step"], "early_stop")]
+                if completions is None:
+                    still_running.append(entry)
+                else:
+                    yield GenerationResult(request, completions, count_tokens(request.prompt), entry["ttft"], now - entry["submitted"])
+            running = still_running
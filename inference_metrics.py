@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+import json
+import time
+from collections import Counter
+from inference_backends import LatencySketch
+from cvdp_problems import problem_category
+from response_io import split_responses_path
+
+def metrics_path(responses_file):
+    return split_responses_path(responses_file)[0] + ".metrics.json"
+
+def requests_path(responses_file):
+    return split_responses_path(responses_file)[0] + ".requests.jsonl"
+
+def preemption_count(counters):
+    # The counter is exported as vllm:num_preemptions or, by newer versions, with a _total suffix
+    for name in ("vllm:num_preemptions", "vllm:num_preemptions_total"):
+        if name in counters:
+            return counters[name]
+    return None
+
+class MetricsSummary:
+    # Running totals and latency sketches for one group of requests, so memory does not grow with the run
+    def __init__(self):
+        self.requests = 0
+        self.samples = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.ttft = LatencySketch()
+        self.latency = LatencySketch()
+        self.decode_tokens_per_s = LatencySketch()
+        self.finish_reasons = Counter()
+
+    def add(self, row):
+        self.requests += 1
+        self.samples += row["samples"]
+        self.prompt_tokens += row["prompt_tokens"]
+        self.completion_tokens += row["completion_tokens"]
+        self.ttft.add(row["ttft"])
+        self.latency.add(row["latency"])
+        self.decode_tokens_per_s.add(row["decode_tokens_per_s"])
+        self.finish_reasons.update(row["finish_reasons"])
+
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "samples": self.samples,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "ttft": self.ttft.summary(),
+            "latency": self.latency.summary(),
+            "decode_tokens_per_s": self.decode_tokens_per_s.summary(),
+            "finish_reasons": dict(self.finish_reasons)
+        }
+
+class MetricsRecorder:
+    # Per-request rows go straight to a JSONL sidecar; only the summaries per group are kept in memory
+    def __init__(self, metadata, requests_path, counters=None):
+        self.metadata = metadata
+        self.counters = counters or {}
+        self.requests_path = requests_path
+        self.requests_file = open(requests_path, 'w', encoding='utf-8')
+        self.overall = MetricsSummary()
+        self.groups = {"by_category": {}, "by_difficulty": {}, "by_category_difficulty": {}}
+        self.cached_samples = 0
+        self.schedule = None
+        self.start = time.perf_counter()
+
+    def record(self, data, result):
+        category = problem_category(data, self.metadata)
+        difficulty = self.metadata.get(data["id"], {}).get("difficulty")
+        completion_tokens = sum(c.num_tokens for c in result.completions)
+        # Decode throughput excludes queueing and prefill, which end with the first token
+        decode_time = (result.latency or 0) - (result.ttft or 0)
+        row = {
+            "id": data["id"],
+            "request_id": result.request.request_id,
+            "category": category,
+            "difficulty": difficulty,
+            "samples": len(result.completions),
+            "prompt_tokens": result.prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "ttft": result.ttft,
+            "latency": result.latency,
+            "decode_tokens_per_s": completion_tokens / decode_time if decode_time > 0 else None,
+            "finish_reasons": dict(Counter(c.finish_reason for c in result.completions))
+        }
+        self.requests_file.write(json.dumps(row) + '\n')
+        self.overall.add(row)
+        keys = {
+            "by_category": category or "unknown",
+            "by_difficulty": difficulty or "unknown",
+            "by_category_difficulty": f"{category}/{difficulty or 'unknown'}"
+        }
+        for grouping, key in keys.items():
+            self.groups[grouping].setdefault(key, MetricsSummary()).add(row)
+
+    def write(self, path, backend, load_time, counters):
+        self.requests_file.close()
+        wall = time.perf_counter() - self.start
+        overall = self.overall.to_dict()
+        preempted = preemption_count(counters)
+        if preempted is not None:
+            preempted -= preemption_count(self.counters) or 0
+        metrics = {
+            "backend": backend.name,
+            "model_load_seconds": load_time,
+            "wall_seconds": wall,
+            "output_tokens_per_s": overall["completion_tokens"] / wall if wall > 0 else None,
+            "preemptions": preempted,
+            "cached_samples": self.cached_samples,
+            "schedule": self.schedule,
+            "overall": overall,
+            **{grouping: {key: summary.to_dict() for key, summary in sorted(groups.items())} for grouping, groups in self.groups.items()},
+            "requests_file": self.requests_path
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(metrics, f, indent=2)
+
+        ttft = overall["ttft"]
+        if ttft:
+            print(f"Time to first token: p50 {ttft['p50']:.2f}s, p95 {ttft['p95']:.2f}s; "
+                  f"output throughput {metrics['output_tokens_per_s']:.1f} tokens/s")
+        if preempted:
+            print(f"Preemptions: {int(preempted)}")
+        print(f"Metrics saved to {path}")
@@ -1,76 +1,653 @@
 #!/usr/bin/env python3
+import os
 import json
+import time
 import argparse
-from vllm import LLM, SamplingParams
-
-def load_model(model_name, tensor_parallel_size=1, gpu_memory_utilization=0.9):
-    print(f"Loading vLLM model: {model_name}")
-    print(f"Tensor parallel size: {tensor_parallel_size}")
-    print(f"GPU memory utilization: {gpu_memory_utilization}")
-    
-    llm = LLM(
-        model=model_name,
-        tensor_parallel_size=tensor_parallel_size,
-        gpu_memory_utilization=gpu_memory_utilization,
-        trust_remote_code=True
+import heapq
+import threading
+import functools
+import itertools
+from datetime import datetime
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from completion_cache import CompletionCache, TokenCache, completion_key, text_hash
+from inference_backends import GenerationRequest, LatencySketch, VLLMBackend, OpenAIBackend, MockBackend
+from inference_metrics import MetricsRecorder, metrics_path, requests_path
+from prompt_preflight import PromptTriage
+from data_parallel import DataParallelBackend
+from response_io import open_response_writer, read_responses, split_responses_path
+from cvdp_problems import EDIT_CATEGORIES, load_problem_metadata, load_problem_context, load_history_lengths, problem_category, expected_output_files, early_stop_offset, completion_problem, file_block_regex, OutputLengthEstimator, TokenBudgeter
+
+
+def group_by_shared_prefix(prompts, min_prefix_chars=256):
+    # Sorting places prompts with the longest common prefixes next to each other;
+    # runs whose neighbours share at least min_prefix_chars form one group.
+    order = sorted(range(len(prompts)), key=lambda i: prompts[i])
+    groups = []
+    for i in order:
+        if groups:
+            prefix_len, members = groups[-1]
+            shared = len(os.path.commonprefix([prompts[members[-1]], prompts[i]]))
+            if shared >= min_prefix_chars:
+                groups[-1] = (min(prefix_len, shared), members + [i])
+                continue
+        groups.append((len(prompts[i]), [i]))
+    return groups
+
+def fold_duplicates(pending, config_for):
+    # Byte-identical prompts with the same sampling parameters become one request;
+    # each sample remembers the prompt line it belongs to so outputs can be fanned back out
+    folded = {}
+    for data, seeds in pending:
+        key = (text_hash(data["prompt"]), json.dumps(config_for(data), sort_keys=True))
+        folded.setdefault(key, (data, []))[1].extend((data, s) for s in seeds)
+    return list(folded.values())
+
+def simulated_makespan(lengths, slots):
+    # Decode steps until the last sequence finishes when every free slot takes the next sequence in order
+    finish_times = [0] * min(slots, len(lengths))
+    for length in lengths:
+        heapq.heapreplace(finish_times, finish_times[0] + length)
+    return max(finish_times, default=0)
+
+def scheduler_slots(args):
+    # Sequences decoded concurrently: the engine's batch limit (vLLM's default max_num_seqs is 256)
+    if args.stream_window:
+        return args.stream_window
+    if args.backend == "openai":
+        return args.max_in_flight
+    if args.backend == "mock":
+        return args.mock_max_batch
+    return 256
+
+# Regeneration attempt a of a sample drawn with seed s uses seed s + a * RETRY_SEED_STRIDE,
+# far away from the seed + k range of the regular samples
+RETRY_SEED_STRIDE = 1000003
+
+class RequestFeed:
+    # Unlike a generator, this iterator can produce requests again after running dry,
+    # so failed samples can be resubmitted while the backend is still generating
+    def __init__(self, requests):
+        self.requests = requests
+        self.resubmitted = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.resubmitted:
+            return self.resubmitted.popleft()
+        return next(self.requests)
+
+    def resubmit(self, request):
+        self.resubmitted.append(request)
+
+def parse_deadline(spec, now=None):
+    # An ISO timestamp such as 2026-10-17T06:00, or a duration from now such as 5400, 90m or 3h
+    now = time.time() if now is None else now
+    units = {"s": 1, "m": 60, "h": 3600}
+    if spec[-1:] in units and spec[:-1].replace(".", "", 1).isdigit():
+        return now + float(spec[:-1]) * units[spec[-1]]
+    if spec.replace(".", "", 1).isdigit():
+        return now + float(spec)
+    return datetime.fromisoformat(spec).timestamp()
+
+class DeadlineGuard:
+    # Stops admitting requests that are not projected to finish before the deadline, and cancels
+    # whatever is still running once only the shutdown margin is left
+    def __init__(self, deadline, margin, backend):
+        self.deadline = deadline
+        self.cutoff = deadline - margin
+        self.backend = backend
+        self.latencies = LatencySketch()
+        self.projected = 0.0
+        self.closed = False
+        self.timer = threading.Timer(max(0.0, self.cutoff - time.time()), self.expire)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def observe(self, latency):
+        if latency is None:
+            return
+        self.latencies.add(latency)
+        if self.latencies.count % 32 == 1:
+            self.projected = self.latencies.quantile(0.9)
+
+    def admit(self):
+        if not self.closed and time.time() + self.projected >= self.cutoff:
+            print(f"Deadline: no new requests admitted, p90 request latency {self.projected:.0f}s would overrun it")
+            self.closed = True
+        return not self.closed
+
+    def expire(self):
+        print("Deadline: shutdown margin reached, aborting requests in flight")
+        self.closed = True
+        self.backend.cancel()
+
+    def stop(self):
+        self.timer.cancel()
+
+def write_remaining_manifest(path, deadline, remaining):
+    by_id = {}
+    for prompt_id, sample in sorted(remaining):
+        by_id.setdefault(prompt_id, []).append(sample)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "deadline": datetime.fromtimestamp(deadline).isoformat(timespec="seconds"),
+            "remaining_samples": len(remaining),
+            "remaining": [{"id": prompt_id, "samples": samples} for prompt_id, samples in by_id.items()]
+        }, f, indent=2)
+    print(f"{len(remaining)} samples of {len(by_id)} ids did not finish before the deadline; listed in {path} (rerun with --resume)")
+
+def completed_samples(records):
+    # Sample indices already written per id. Records without an index (older files) take the lowest free ones.
+    done, unindexed = {}, Counter()
+    for record in records:
+        if record.get("sample") is None:
+            unindexed[record["id"]] += 1
+        else:
+            done.setdefault(record["id"], set()).add(record["sample"])
+    for prompt_id, count in unindexed.items():
+        indices = done.setdefault(prompt_id, set())
+        free = (k for k in itertools.count() if k not in indices)
+        indices.update(itertools.islice(free, count))
+    return done
+
+def load_completed_samples(responses_file):
+    if not os.path.exists(responses_file):
+        return {}
+
+    if split_responses_path(responses_file)[1] != ".jsonl":
+        # Compressed and columnar files cannot be cut at a byte offset, and a frame cut off by a crash
+        # may decode silently to a shorter text; keep the complete records and rewrite the file from them
+        records = []
+        try:
+            for record in read_responses(responses_file):
+                records.append(record)
+        except Exception as e:
+            print(f"Dropping unreadable tail of {responses_file} ({e.__class__.__name__})")
+        with open_response_writer(responses_file) as writer:
+            for record in records:
+                writer.write(record["id"], record["completion"], record.get("sample"), record.get("num_tokens"), record.get("finish_reason"))
+        return completed_samples(records)
+
+    records = []
+    valid_size = 0
+    with open(responses_file, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                    records.append({"id": record["id"], "sample": record.get("sample")})
+                except (json.JSONDecodeError, KeyError):
+                    break
+            valid_size += len(line)
+
+    # A crash can leave a half-written last line behind; drop it so appends stay valid JSONL
+    if valid_size < os.path.getsize(responses_file):
+        print(f"Truncating incomplete tail of {responses_file}")
+        with open(responses_file, 'r+b') as f:
+            f.truncate(valid_size)
+    return completed_samples(records)
+
+def create_backend(args):
+    if args.data_parallel > 1:
+        return DataParallelBackend(functools.partial(create_engine_backend, args), args.data_parallel, args.tensor_parallel_size)
+    return create_engine_backend(args)
+
+def create_engine_backend(args):
+    if args.backend == "openai":
+        return OpenAIBackend(args.endpoint, args.model, args.max_in_flight, args.max_retries)
+    if args.backend == "mock":
+        return MockBackend(args.mock_replay, args.mock_token_latency, args.mock_max_batch)
+    return VLLMBackend(
+        args.model,
+        args.tensor_parallel_size,
+        args.gpu_memory_utilization,
+        not args.no_prefix_caching,
+        args.num_speculative_tokens if args.speculative_ngram else 0,
+        args.max_model_len
     )
-    return llm
 
-def process_prompts_batch(prompts_file, responses_file, model_name, samples_per_prompt=1, tensor_parallel_size=1, gpu_memory_utilization=0.9):
-    llm = load_model(model_name, tensor_parallel_size, gpu_memory_utilization)
-    
-    prompts_data = []
+# Records sorted in memory at a time when reordering; the sorted runs are merged from disk
+REORDER_RUN_RECORDS = 20000
+
+def reorder_responses(responses_file, prompts_file, run_records=REORDER_RUN_RECORDS):
+    # Replicas finish in any order; put the responses back into prompt file order, each id's samples by index.
+    # An external merge sort, so memory holds one run of records and the id positions, not the whole file.
+    position = {}
+    for data in read_prompts(prompts_file):
+        position.setdefault(data["id"], len(position))
+    sort_key = lambda record: (position.get(record["id"], len(position)), record.get("sample") or 0)
+    root, ext = split_responses_path(responses_file)
+    runs = []
+    try:
+        records = read_responses(responses_file)
+        while True:
+            chunk = sorted(itertools.islice(records, run_records), key=sort_key)
+            if not chunk:
+                break
+            runs.append(f"{root}.sort{len(runs)}.jsonl")
+            with open(runs[-1], 'w', encoding='utf-8') as f:
+                for record in chunk:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        merged = heapq.merge(*(read_prompts(run) for run in runs), key=sort_key)
+        with open_response_writer(f"{root}.tmp{ext}") as writer:
+            for record in merged:
+                writer.write(record["id"], record["completion"], record.get("sample"), record.get("num_tokens"), record.get("finish_reason"))
+        os.replace(f"{root}.tmp{ext}", responses_file)
+    finally:
+        for run in runs:
+            os.remove(run)
+
+def read_prompts(prompts_file):
     with open(prompts_file, 'r', encoding='utf-8') as f:
         for line in f:
-            prompts_data.append(json.loads(line.strip()))
-    
-    sampling_params = SamplingParams(
-        temperature=0.8 if samples_per_prompt > 1 else 0.1,
-        top_p=0.9,
-        max_tokens=2048,
-        n=samples_per_prompt
-    )
-    
-    prompts = [data["prompt"] for data in prompts_data]
-    print(f"Processing {len(prompts)} prompts with {samples_per_prompt} samples each...")
-    
-    outputs = llm.generate(prompts, sampling_params)
-    
-    responses = []
-    for i, output in enumerate(outputs):
-        prompt_id = prompts_data[i]["id"]
-        for sample_output in output.outputs:
-            response_text = sample_output.text.strip()
-            responses.append({
-                "id": prompt_id,
-                "completion": response_text
-            })
-    
-    with open(responses_file, 'w', encoding='utf-8') as f:
-        for response in responses:
-            f.write(json.dumps(response, ensure_ascii=False) + '\n')
-    
-    print(f"Generated {len(responses)} responses and saved to {responses_file}")
+            if line.strip():
+                yield json.loads(line)
+
+def plan_samples(prompts, samples_per_prompt, seed, done):
+    # Every sample of an id gets its own index, so sample k is always drawn with seed + k.
+    # The same id may appear on several lines; each line accounts for samples_per_prompt of them.
+    # Indices already in the responses file are skipped, whichever order they finished in.
+    next_index = Counter()
+    for data in prompts:
+        first = next_index[data["id"]]
+        next_index[data["id"]] += samples_per_prompt
+        written = done.get(data["id"], ())
+        seeds = [seed + k for k in range(first, first + samples_per_prompt) if k not in written]
+        if seeds:
+            yield data, seeds
+
+def shared_prompts(prompts):
+    # Hashes of prompts that appear under more than one id
+    ids = {}
+    for data in prompts:
+        ids.setdefault(text_hash(data["prompt"]), set()).add(data["id"])
+    return {key for key, members in ids.items() if len(members) > 1}
+
+def serve_from_cache(pending, cache, writer, key_for, base_seed):
+    for data, seeds in pending:
+        missing = []
+        for sample_seed in seeds:
+            completion = cache.get(key_for(data, sample_seed))
+            if completion is None:
+                missing.append(sample_seed)
+            else:
+                writer.write(data["id"], completion, sample_seed - base_seed, finish_reason="cached")
+        if missing:
+            yield data, missing
+
+def parse_sweep(spec):
+    # Either a JSON file holding a list of parameter dicts, or a grid such as "temperature=0.2,0.8;top_p=0.9,0.95"
+    if os.path.isfile(spec):
+        with open(spec, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    axes = []
+    for axis in spec.split(";"):
+        if not axis.strip():
+            continue
+        name, values = axis.split("=", 1)
+        parsed = []
+        for value in values.split(","):
+            try:
+                parsed.append(json.loads(value))
+            except json.JSONDecodeError:
+                parsed.append(value)
+        axes.append([(name.strip(), v) for v in parsed])
+    return [dict(point) for point in itertools.product(*axes)]
+
+def sweep_tag(overrides):
+    return "_".join(f"{k}{v}" for k, v in sorted(overrides.items()))
+
+def tagged_path(path, tag):
+    root, ext = split_responses_path(path)
+    return f"{root}.{tag}{ext}"
+
+def load_backend(backend, speculative=False):
+    start = time.perf_counter()
+    backend.load(speculative)
+    backend.loaded = True
+    backend.load_time = time.perf_counter() - start
+    print(f"Model loaded in {backend.load_time:.1f}s")
+
+def lazy_load(args):
+    return args.lazy_load or args.resume or bool(args.cache_file)
+
+def ingest_prompts(args, backend, token_cache):
+    # Everything that only needs the input files, so it can run while the weights load
+    problems = {
+        "metadata": load_problem_metadata(args.dataset),
+        "context": load_problem_context(args.context_file),
+        "history": {}
+    }
+    prompts = None if args.stream_window else list(read_prompts(args.prompts_file))
+    if args.history:
+        categories_by_id = {data["id"]: problem_category(data, problems["metadata"]) for data in prompts or read_prompts(args.prompts_file)}
+        problems["history"] = load_history_lengths(args.history, categories_by_id)
+    if token_cache and prompts:
+        # Fill the token cache so the preflight pass only has to look the token ids up
+        PromptTriage(backend, None, 0, token_cache).token_counts(list({data["prompt"]: None for data in prompts}))
+        print(f"Token cache fill: {token_cache.hits} prompts already cached, {token_cache.misses} tokenized while the model loads")
+        # The preflight pass counts its own lookups
+        token_cache.hits = token_cache.misses = 0
+    return problems, prompts
+
+def generate_responses(backend, args, responses_file, sampling_config, cache, problems, token_cache=None, prompts=None, deadline=None):
+    done = load_completed_samples(responses_file) if args.resume else {}
+    if args.resume:
+        print(f"Resuming: found {sum(len(indices) for indices in done.values())} existing responses in {responses_file}")
+
+    budgeter = None
+    if args.adaptive_max_tokens:
+        budgeter = TokenBudgeter(sampling_config["max_tokens"], args.min_tokens, problems["context"], problems["metadata"], problems["history"])
+
+    def budget_for(data):
+        return budgeter.budget(data) if budgeter else sampling_config["max_tokens"]
+
+    triage = None
+    if args.preflight:
+        triage = PromptTriage(backend, args.max_model_len or backend.context_length(), args.min_tokens, token_cache)
+
+    def config_for(data):
+        max_tokens = budget_for(data)
+        if triage:
+            max_tokens = triage.max_tokens(data, max_tokens)
+        if max_tokens != sampling_config["max_tokens"]:
+            return dict(sampling_config, max_tokens=max_tokens)
+        return sampling_config
+
+    # Guided and free-form completions of the same prompt are separate cache entries
+    guided = "file-blocks" if args.guided_decoding else None
+    window = args.stream_window
+    folding = args.fold_duplicates and not window and not args.early_stop
+    # A folded request draws all samples of a duplicated prompt from one seed, one per id and sample,
+    # so those are cached per id; otherwise every id would share, and overwrite, the same entries
+    folded_prompts = shared_prompts(prompts) if folding and cache else set()
+
+    def cache_key(data, sample_seed):
+        owner = data["id"] if folded_prompts and text_hash(data["prompt"]) in folded_prompts else None
+        return completion_key(args.model, data["prompt"], config_for(data), sample_seed, guided, owner)
+
+    metrics = MetricsRecorder(problems["metadata"], requests_path(responses_file), backend.counters() if backend.loaded else None)
+    with open_response_writer(responses_file, append=args.resume, checkpoint_interval=args.checkpoint_interval) as writer:
+        pending = plan_samples(prompts if prompts is not None else read_prompts(args.prompts_file), args.samples, args.seed, done)
+        if triage:
+            # Prompts that cannot fit the context window never reach the engine
+            pending = triage.filter(pending, budget_for)
+        if cache:
+            hits, misses = cache.hits, cache.misses
+            pending = serve_from_cache(pending, cache, writer, cache_key, args.seed)
+
+        speculative_categories = set(args.speculative_categories.split(",")) if args.speculative_ngram else None
+        speculative = bool(speculative_categories)
+        groups = None
+        if window:
+            # Streaming keeps the planning chain lazy; only the next pending prompt is read ahead
+            first = next(pending, None)
+            pending = itertools.chain([first], pending) if first else None
+        else:
+            pending = list(pending)
+
+        if pending and not window:
+            texts = [data["prompt"] for data, _ in pending]
+            if args.order == "prefix":
+                groups = group_by_shared_prefix(texts)
+                preamble = len(os.path.commonprefix(texts))
+                shared = [g for g in groups if len(g[1]) > 1]
+                print(f"Common preamble across all prompts: {preamble} chars")
+                print(f"Grouped {len(pending)} prompts into {len(groups)} prefix groups ({len(shared)} shared)")
+                pending = [pending[i] for _, members in groups for i in members]
+            elif args.order == "longest":
+                # Long generations start first so the end of the run is not a few stragglers on an idle GPU
+                estimator = OutputLengthEstimator(problems["context"], problems["metadata"], problems["history"])
+                predicted = [estimator.estimate(data, config_for(data)["max_tokens"]) for data, _ in pending]
+                order = sorted(range(len(pending)), key=lambda i: -predicted[i])
+                slots = scheduler_slots(args)
+                before = simulated_makespan([predicted[i] for i, (_, seeds) in enumerate(pending) for _ in seeds], slots)
+                after = simulated_makespan([predicted[i] for i in order for _ in pending[i][1]], slots)
+                print(f"Longest-expected-output first: predicted makespan {before} -> {after} decode steps "
+                      f"({(after - before) / max(before, 1):+.1%}) with {slots} concurrent sequences")
+                metrics.schedule = {"order": "longest", "slots": slots, "predicted_makespan_file_order": before, "predicted_makespan": after}
+                pending = [pending[i] for i in order]
+
+            # Speculative decoding is an engine-wide setting, so it is switched on only
+            # when the run actually contains prompts from an opted-in category
+            if speculative_categories:
+                eligible = Counter(problem_category(data, problems["metadata"]) for data, _ in pending)
+                eligible = {c: k for c, k in eligible.items() if c in speculative_categories}
+                speculative = bool(eligible)
+                if eligible:
+                    print(f"Speculative decoding eligible prompts: {eligible}")
+
+        if pending:
+            # The engine is loaded once and then shared by every sweep configuration
+            if not backend.loaded:
+                load_backend(backend, speculative)
+                metrics.counters = backend.counters()
+            if backend.prefix_caching and groups:
+                # Prefill each shared prefix once so the group members find it in the cache
+                prefixes = [texts[members[0]][:prefix_len] for prefix_len, members in groups if len(members) > 1]
+                if prefixes:
+                    print(f"Warming prefix cache with {len(prefixes)} shared prefixes...")
+                    backend.warm_prefixes(prefixes)
+
+            if folding:
+                requests_before = len(pending)
+                pending = fold_duplicates(pending, config_for)
+                print(f"Folded {requests_before} prompts into {len(pending)} requests with distinct prompts")
+            else:
+                pending = ((data, [(data, s) for s in seeds]) for data, seeds in pending)
+            pending = iter(pending)
+
+            guard = DeadlineGuard(deadline, args.deadline_margin, backend) if deadline else None
+            # Backends pull as many requests as their window allows; without one they would take the whole
+            # plan at the start, before any latency is known, so the deadline caps it at what runs concurrently
+            admission_window = scheduler_slots(args) if guard else window
+            # Samples handed to the backend but not written yet, as (id, sample index)
+            unfinished = set()
+
+            # Only requests that are still running are kept in memory
+            in_flight = {}
+            def requests():
+                for i, (data, samples) in enumerate(pending):
+                    unfinished.update((owner["id"], seed - args.seed) for owner, seed in samples)
+                    if guard and not guard.admit():
+                        return
+                    config = config_for(data)
+                    if budgeter:
+                        budgeter.record(config["max_tokens"], len(samples))
+                    files = expected_output_files(data, problems["context"]) if args.early_stop or args.max_regenerations or args.guided_decoding else None
+                    expected_files = files if args.early_stop else None
+                    guided_regex = file_block_regex(files) if args.guided_decoding else None
+                    # Early stopping works per sample, so each sample becomes its own request
+                    batches = [[s] for s in samples] if expected_files else [samples]
+                    for k, batch in enumerate(batches):
+                        request_id = f"{i}.{k}"
+                        in_flight[request_id] = (data, batch, config, files, 0)
+                        params = dict(config, n=len(batch), seed=batch[0][1])
+                        yield GenerationRequest(request_id, data["prompt"], params, data["id"], expected_files, guided_regex)
+
+            if window:
+                print(f"Streaming prompts with up to {window} requests in flight...")
+            else:
+                print(f"Processing {len(texts)} prompts with {args.samples} samples each...")
+
+            feed = RequestFeed(requests())
+            early_stopped, tokens_released = 0, 0
+            regenerations, rejected = Counter(), 0
+            for result in backend.generate(feed, admission_window, early_stop_offset if args.early_stop else None):
+                data, samples, config, files, attempt = in_flight.pop(result.request.request_id)
+                metrics.record(data, result)
+                if guard:
+                    guard.observe(result.latency)
+                for (owner, sample_seed), completion in zip(samples, result.completions):
+                    if completion.finish_reason == "early_stop":
+                        early_stopped += 1
+                        tokens_released += max(0, config["max_tokens"] - completion.num_tokens)
+                    response_text = completion.text.strip()
+                    problem = completion_problem(response_text, files) if args.max_regenerations else None
+                    if problem and attempt < args.max_regenerations and not (guard and guard.closed):
+                        # Ask the still-loaded engine for another sample under a new seed
+                        regenerations[problem] += 1
+                        request_id = f"{result.request.request_id}.r{sample_seed}.{attempt + 1}"
+                        in_flight[request_id] = (data, [(owner, sample_seed)], config, files, attempt + 1)
+                        params = dict(config, n=1, seed=sample_seed + (attempt + 1) * RETRY_SEED_STRIDE)
+                        feed.resubmit(GenerationRequest(request_id, data["prompt"], params, data["id"], result.request.expected_files, result.request.guided_regex))
+                        continue
+                    writer.write(owner["id"], response_text, sample_seed - args.seed, completion.num_tokens, completion.finish_reason)
+                    unfinished.discard((owner["id"], sample_seed - args.seed))
+                    if problem:
+                        rejected += 1
+                    elif cache:
+                        # The accepted completion stands in for the sample's own seed
+                        cache.put(cache_key(owner, sample_seed), response_text)
+
+            if guard:
+                guard.stop()
+                # Whatever was never admitted is still waiting in the plan
+                for data, samples in pending:
+                    unfinished.update((owner["id"], seed - args.seed) for owner, seed in samples)
+                if unfinished:
+                    write_remaining_manifest(split_responses_path(responses_file)[0] + ".remaining.json", deadline, unfinished)
+
+            if budgeter:
+                budgeter.report(backend.kv_cache_bytes_per_token(), scheduler_slots(args))
+            if args.early_stop:
+                print(f"Early stop: {early_stopped} samples ended once all expected files were emitted, "
+                      f"releasing up to {tokens_released} tokens of decode budget")
+            if args.max_regenerations:
+                print(f"Regenerated {sum(regenerations.values())} samples ({dict(regenerations)}); "
+                      f"{rejected} still failed validation after {args.max_regenerations} attempts")
+        else:
+            print(f"All prompts already have {args.samples} samples or were skipped, nothing to generate")
+
+    if args.data_parallel > 1:
+        reorder_responses(responses_file, args.prompts_file)
+    if triage:
+        triage.write(split_responses_path(responses_file)[0] + ".preflight.json")
+    if cache:
+        metrics.cached_samples = cache.hits - hits
+        print(f"Completion cache: {cache.hits - hits} hits, {cache.misses - misses} misses")
+    print(f"Generated {writer.count} responses and saved to {responses_file}")
+    metrics.write(metrics_path(responses_file), backend, backend.load_time, backend.counters() if backend.loaded else {})
+
+def process_prompts_batch(backend, args, deadline=None):
+    sampling_config = {
+        "temperature": 0.8 if args.samples > 1 else 0.1,
+        "top_p": 0.9,
+        "max_tokens": args.max_tokens
+    }
+
+    cache = CompletionCache(args.cache_file, args.cache_max_mb * 1024 * 1024) if args.cache_file else None
+    token_cache = None
+    if args.preflight:
+        token_cache = TokenCache(args.token_cache or os.path.splitext(args.prompts_file)[0] + ".tokens.db")
+
+    with ThreadPoolExecutor(1) as executor:
+        ingestion = executor.submit(ingest_prompts, args, backend, token_cache)
+        # The engine configuration depends on the prompts only when speculative decoding is opt-in per category.
+        # With a cache or a resumed file, a rerun may have nothing left to generate and should not load the model at all.
+        if not lazy_load(args) and not args.speculative_ngram:
+            load_backend(backend)
+        problems, prompts = ingestion.result()
+
+    if args.sweep:
+        runs = []
+        for overrides in parse_sweep(args.sweep):
+            tag = sweep_tag(overrides)
+            config = dict(sampling_config, **overrides)
+            print(f"=== Sweep configuration {tag}: {config} ===")
+            responses_file = tagged_path(args.responses_file, tag)
+            generate_responses(backend, args, responses_file, config, cache, problems, token_cache, prompts, deadline)
+            runs.append({"tag": tag, "sampling_params": config, "responses_file": responses_file})
+
+        index_file = split_responses_path(args.responses_file)[0] + ".sweep.json"
+        with open(index_file, 'w', encoding='utf-8') as f:
+            json.dump(runs, f, indent=2)
+        print(f"Sweep of {len(runs)} configurations indexed in {index_file}")
+    else:
+        generate_responses(backend, args, args.responses_file, sampling_config, cache, problems, token_cache, prompts, deadline)
+
+    if backend.loaded:
+        backend.report()
+        backend.close()
+    if cache:
+        cache.close()
+    if token_cache:
+        token_cache.close()
 
 def main():
     parser = argparse.ArgumentParser(description="CVDP Benchmark Local Inference with vLLM")
     parser.add_argument("--prompts-file", required=True, help="Input prompts JSONL file")
-    parser.add_argument("--responses-file", required=True, help="Output responses JSONL file")
+    parser.add_argument("--responses-file", required=True, help="Output responses file: .jsonl, zstd-compressed .jsonl.zst, or .parquet with per-sample token counts")
     parser.add_argument("--model", required=True, help="Model name or path")
+    parser.add_argument("--backend", choices=["vllm", "openai", "mock"], default=None, help="Generation backend (default: openai with --endpoint, otherwise vllm)")
+    parser.add_argument("--endpoint", default=None, help="Base URL of a running OpenAI-compatible server, e.g. http://localhost:8000")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="Concurrent HTTP requests against --endpoint")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries with exponential backoff for failed HTTP requests")
+    parser.add_argument("--mock-replay", default=None, help="Responses file (.jsonl, .jsonl.zst or .parquet) whose completions the mock backend replays by id")
+    parser.add_argument("--mock-token-latency", type=float, default=0.0, help="Seconds per decode step of the mock backend")
+    parser.add_argument("--mock-max-batch", type=int, default=256, help="Concurrent requests the mock backend decodes per step")
     parser.add_argument("--samples", type=int, default=1, help="Number of samples per prompt")
+    parser.add_argument("--max-tokens", type=int, default=2048, help="Maximum completion tokens (the cap for adaptive budgets)")
     parser.add_argument("--tensor-parallel-size", type=int, default=1, help="Tensor parallel size")
+    parser.add_argument("--data-parallel", type=int, default=1, help="Engine replicas in separate worker processes, each on its own tensor-parallel group of GPUs")
     parser.add_argument("--gpu-memory-utilization", type=float, default=0.9, help="GPU memory utilization ratio")
-    
+    parser.add_argument("--resume", action="store_true", help="Keep existing responses and only generate the missing samples per id")
+    parser.add_argument("--checkpoint-interval", type=int, default=16, help="fsync the responses file every N completions")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed; sample k of each id is drawn with seed + k")
+    parser.add_argument("--cache-file", default=None, help="SQLite completion cache shared across runs")
+    parser.add_argument("--cache-max-mb", type=int, default=2048, help="Evict least recently used cache entries beyond this size")
+    parser.add_argument("--deadline", default=None, help="Wall-clock limit, as an ISO time or a duration such as 90m or 3h: stop admitting requests that would overrun it and flush what finished")
+    parser.add_argument("--deadline-margin", type=float, default=120, help="Seconds before the deadline at which running requests are aborted and results flushed")
+    parser.add_argument("--lazy-load", action="store_true", help="Load the model only once there is something to generate, instead of while the prompts are read (implied by --resume and --cache-file)")
+    parser.add_argument("--no-prefix-caching", action="store_true", help="Disable vLLM automatic prefix caching")
+    parser.add_argument("--sweep", default=None, help="Grid such as 'temperature=0.2,0.8;top_p=0.9,0.95' or a JSON list of sampling overrides; one tagged responses file per point")
+    parser.add_argument("--stream-window", type=int, default=None, help="Read prompts lazily and keep at most N requests in flight, for very large prompt files")
+    parser.add_argument("--order", choices=["file", "prefix", "longest"], default="prefix", help="Submit prompts in file order, grouped by shared prefix, or longest expected output first (ignored with --stream-window)")
+    parser.add_argument("--dataset", default=None, help="CVDP dataset JSONL, or a cvdp_dataset.py snapshot directory, used to look up each prompt's category and difficulty")
+    parser.add_argument("--context-file", default=None, help="prompt_response.jsonl from the export step, listing each problem's input and expected output files")
+    parser.add_argument("--adaptive-max-tokens", action="store_true", help="Derive max_tokens per prompt from its expected outputs, input RTL size and history")
+    parser.add_argument("--min-tokens", type=int, default=256, help="Smallest max_tokens budget given to any prompt")
+    parser.add_argument("--history", nargs="*", default=None, help="Earlier responses files (.jsonl, .jsonl.zst or .parquet) used for per-category completion lengths")
+    parser.add_argument("--early-stop", action="store_true", help="End a sample as soon as a code block has been emitted for every expected output file")
+    parser.add_argument("--fold-duplicates", action="store_true", help="Submit byte-identical prompts once with n covering all their samples (ignored with --stream-window or --early-stop)")
+    parser.add_argument("--guided-decoding", action="store_true", help="Constrain output to each expected file's path followed by a fenced code block (regex-guided decoding; ignored by the mock backend)")
+    parser.add_argument("--max-regenerations", type=int, default=0, help="Resubmit empty completions, or ones missing a code block for an expected file, up to N times with a new seed")
+    parser.add_argument("--speculative-ngram", action="store_true", help="Enable n-gram prompt-lookup speculative decoding for edit-heavy categories")
+    parser.add_argument("--speculative-categories", default=EDIT_CATEGORIES, help="Comma-separated categories that opt into speculative decoding")
+    parser.add_argument("--preflight", action="store_true", help="Tokenize all prompts before generation and skip or shorten those that overflow the context window")
+    parser.add_argument("--max-model-len", type=int, default=None, help="Context window in tokens (default: from the model config)")
+    parser.add_argument("--token-cache", default=None, help="SQLite cache of prompt token ids (default: next to the prompts file)")
+    parser.add_argument("--num-speculative-tokens", type=int, default=5, help="Draft tokens proposed per step by the n-gram lookup")
+
     args = parser.parse_args()
-    
-    process_prompts_batch(
-        args.prompts_file,
-        args.responses_file,
-        args.model,
-        args.samples,
-        args.tensor_parallel_size,
-        args.gpu_memory_utilization
-    )
+    if args.backend is None:
+        args.backend = "openai" if args.endpoint else "vllm"
+    if args.backend == "openai" and not args.endpoint:
+        parser.error("--backend openai requires --endpoint")
+    if args.backend == "openai" and args.data_parallel > 1:
+        parser.error("--data-parallel starts local engines; scale a server with --max-in-flight instead")
+    # Fail on missing inputs before any model weights are touched
+    for path in [args.prompts_file, args.context_file, args.mock_replay] + (args.history or []):
+        if path and not os.path.isfile(path):
+            parser.error(f"input file not found: {path}")
+    if args.dataset and not os.path.exists(args.dataset):
+        parser.error(f"dataset not found: {args.dataset}")
+
+    # Relative deadlines count from startup, so model loading is part of the budget
+    deadline = None
+    if args.deadline:
+        try:
+            deadline = parse_deadline(args.deadline)
+        except ValueError:
+            parser.error(f"--deadline: cannot parse {args.deadline!r}")
+
+    process_prompts_batch(create_backend(args), args, deadline)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import json
+import time
+import random
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from inference_backends import GenerationRequest, MockBackend, count_tokens, mock_tokens
+
+def make_handler(backend, token_latency, fail_rate):
+    class CompletionsHandler(BaseHTTPRequestHandler):
+        # HTTP/1.1 keeps connections alive so clients can exercise their connection pool
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if self.path != "/v1/completions":
+                self.send_json(404, {"error": f"unknown path {self.path}"})
+                return
+            if random.random() < fail_rate:
+                self.send_json(503, {"error": "injected failure"})
+                return
+
+            params = {k: payload[k] for k in ("n", "seed", "max_tokens") if k in payload}
+            request = GenerationRequest("stub", payload["prompt"], params)
+            completions = [backend.completion(request, i) for i in range(params.get("n", 1))]
+            if payload.get("stream"):
+                self.stream_completions(payload, completions)
+                return
+            time.sleep(token_latency * max(c.num_tokens for c in completions))
+
+            self.send_json(200, {
+                "object": "text_completion",
+                "model": payload.get("model"),
+                "choices": [
+                    {"index": i, "text": c.text, "finish_reason": c.finish_reason}
+                    for i, c in enumerate(completions)
+                ],
+                "usage": {
+                    "prompt_tokens": count_tokens(payload["prompt"]),
+                    "completion_tokens": sum(c.num_tokens for c in completions)
+                }
+            })
+
+        def stream_completions(self, payload, completions):
+            # Server-sent events, one chunk per mock token and sample, as the vLLM server streams them
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            tokens = [mock_tokens(c.text) for c in completions]
+            steps = []
+            for step in range(max(len(t) for t in tokens)):
+                steps.append([
+                    {"index": i, "text": t[step], "finish_reason": c.finish_reason if step == len(t) - 1 else None}
+                    for i, (c, t) in enumerate(zip(completions, tokens)) if step < len(t)
+                ])
+            usage = {"prompt_tokens": count_tokens(payload["prompt"]), "completion_tokens": sum(len(t) for t in tokens)}
+            try:
+                for choices in steps:
+                    time.sleep(token_latency)
+                    self.write_chunk(f"data: {json.dumps({'choices': choices})}\n\n")
+                self.write_chunk(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n")
+                self.write_chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped reading, e.g. after an early stop
+                self.close_connection = True
+
+        def write_chunk(self, text):
+            data = text.encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        def send_json(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return CompletionsHandler
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping pooled or early-stopped connections is expected, not an error
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server backed by the mock engine")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds of simulated decode time per token")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 503")
+
+    args = parser.parse_args()
+
+    server = StubServer((args.host, args.port), make_handler(MockBackend(), args.token_latency, args.fail_rate))
+    print(f"Stub server listening on http://{args.host}:{args.port}/v1/completions")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+import json
+import time
+import itertools
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from completion_cache import text_hash
+
+FITS, TRUNCATE, SKIP = "fits", "must-truncate", "skip"
+
+class PromptTriage:
+    # Tokenizes prompts ahead of generation and sorts out the ones that cannot fit the context window:
+    # a prompt that leaves less than its max_tokens budget gets a smaller budget, and one that leaves
+    # less than min_tokens is skipped instead of failing or being truncated inside the engine
+    def __init__(self, backend, context_length, min_tokens, token_cache=None, batch_size=256, workers=4):
+        self.backend = backend
+        self.context_length = context_length
+        self.min_tokens = min_tokens
+        self.token_cache = token_cache
+        self.batch_size = batch_size
+        self.workers = workers
+        self.limits = {}
+        self.counts = Counter()
+        self.truncated = []
+        self.skipped = []
+        self.tokenize_seconds = 0.0
+
+    def token_counts(self, prompts):
+        keys = [text_hash(f"{self.backend.tokenizer_name}\0{prompt}") for prompt in prompts]
+        found = self.token_cache.get_many(list(set(keys))) if self.token_cache else {}
+        missing = list({key: prompt for key, prompt in zip(keys, prompts) if key not in found}.items())
+        if missing:
+            start = time.perf_counter()
+            # Fast tokenizers release the GIL, so batches are encoded in parallel threads
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            with ThreadPoolExecutor(self.workers) as executor:
+                encoded = executor.map(lambda batch: self.backend.tokenize([prompt for _, prompt in batch]), batches)
+                new = [(key, ids) for batch, ids_list in zip(batches, encoded) for (key, _), ids in zip(batch, ids_list)]
+            self.tokenize_seconds += time.perf_counter() - start
+            found.update(new)
+            if self.token_cache:
+                self.token_cache.put_many(new)
+        return [len(found[key]) for key in keys]
+
+    def classify(self, prompt_tokens, max_tokens):
+        if not self.context_length or prompt_tokens + max_tokens <= self.context_length:
+            return FITS
+        if prompt_tokens + self.min_tokens <= self.context_length:
+            return TRUNCATE
+        return SKIP
+
+    def filter(self, pending, budget_for):
+        # Works through the pending prompts in chunks so streaming runs stay lazy
+        pending = iter(pending)
+        while True:
+            chunk = list(itertools.islice(pending, self.batch_size * self.workers))
+            if not chunk:
+                return
+            for (data, seeds), prompt_tokens in zip(chunk, self.token_counts([data["prompt"] for data, _ in chunk])):
+                max_tokens = budget_for(data)
+                status = self.classify(prompt_tokens, max_tokens)
+                self.counts[status] += len(seeds)
+                if status == SKIP:
+                    self.skipped.append({"id": data["id"], "prompt_tokens": prompt_tokens, "samples": len(seeds)})
+                    continue
+                if status == TRUNCATE:
+                    self.limits[data["id"]] = self.context_length - prompt_tokens
+                    self.truncated.append({"id": data["id"], "prompt_tokens": prompt_tokens, "max_tokens": self.limits[data["id"]]})
+                yield data, seeds
+
+    def max_tokens(self, data, max_tokens):
+        return min(max_tokens, self.limits.get(data["id"], max_tokens))
+
+    def write(self, path):
+        report = {
+            "context_length": self.context_length,
+            "min_tokens": self.min_tokens,
+            "samples": dict(self.counts),
+            "tokenize_seconds": self.tokenize_seconds,
+            "truncated": self.truncated,
+            "skipped": self.skipped
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+        if self.token_cache:
+            print(f"Token cache: {self.token_cache.hits} prompts reused, {self.token_cache.misses} tokenized")
+        if not self.context_length:
+            print("Preflight: context length unknown, every prompt treated as fitting (set --max-model-len)")
+        print(f"Preflight against {self.context_length} tokens: {self.counts[FITS]} samples fit, "
+              f"{self.counts[TRUNCATE]} with a reduced max_tokens, {self.counts[SKIP]} skipped; report saved to {path}")
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+import io
+import os
+import sys
+import json
+import argparse
+import threading
+
+# The format of a responses file follows from its name
+ZSTD_SUFFIX = ".jsonl.zst"
+PARQUET_SUFFIX = ".parquet"
+
+def split_responses_path(path):
+    # Like os.path.splitext, but keeps compound suffixes such as .jsonl.zst together
+    if path.endswith(ZSTD_SUFFIX):
+        return path[:-len(ZSTD_SUFFIX)], ZSTD_SUFFIX
+    return os.path.splitext(path)
+
+def jsonl_record(record):
+    # The sample index lets --resume skip exactly the samples that were written, which finish out of order
+    line = {"id": record["id"], "completion": record["completion"]}
+    if record.get("sample") is not None:
+        line["sample"] = record["sample"]
+    return line
+
+class ResponseWriter:
+    # Plain JSONL in the layout the CVDP import step reads, plus each record's sample index
+    def __init__(self, path, append=False, checkpoint_interval=16):
+        self.path = path
+        self.checkpoint_interval = max(1, checkpoint_interval)
+        self.count = 0
+        # Cache hits are written from the thread that pulls the request feed, results from the main thread
+        self.lock = threading.Lock()
+        self.open(append)
+
+    def open(self, append):
+        self.f = open(self.path, 'a' if append else 'w', encoding='utf-8')
+
+    def write(self, prompt_id, completion, sample=None, num_tokens=None, finish_reason=None):
+        with self.lock:
+            self.emit({"id": prompt_id, "completion": completion, "sample": sample, "num_tokens": num_tokens, "finish_reason": finish_reason})
+            self.count += 1
+            if self.count % self.checkpoint_interval == 0:
+                self.checkpoint()
+
+    def emit(self, record):
+        self.f.write(json.dumps(jsonl_record(record), ensure_ascii=False) + '\n')
+        self.f.flush()
+
+    def checkpoint(self):
+        os.fsync(self.f.fileno())
+
+    def close(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ZstdResponseWriter(ResponseWriter):
+    # Same records as JSONL; every checkpoint ends a zstd frame, so a crash loses at most one interval
+    def open(self, append):
+        import zstandard
+
+        self.raw = open(self.path, 'ab' if append else 'wb')
+        self.f = zstandard.ZstdCompressor(level=10).stream_writer(self.raw, closefd=False)
+
+    def emit(self, record):
+        self.f.write((json.dumps(jsonl_record(record), ensure_ascii=False) + '\n').encode('utf-8'))
+
+    def checkpoint(self):
+        import zstandard
+
+        self.f.flush(zstandard.FLUSH_FRAME)
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+
+    def close(self):
+        self.checkpoint()
+        self.f.close()
+        self.raw.close()
+
+class ParquetResponseWriter(ResponseWriter):
+    # Columnar output with one row per sample. The footer is only written on close, so resuming
+    # after a crash starts the file over; use .jsonl.zst when runs may be killed.
+    ROW_GROUP_SIZE = 4096
+    COLUMNS = ("id", "sample", "completion", "num_tokens", "finish_reason")
+
+    def open(self, append):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.schema = pa.schema([
+            ("id", pa.string()),
+            ("sample", pa.int32()),
+            ("completion", pa.string()),
+            ("num_tokens", pa.int32()),
+            ("finish_reason", pa.string())
+        ])
+        existing = list(read_responses(self.path)) if append and os.path.exists(self.path) else []
+        self.f = pq.ParquetWriter(self.path, self.schema, compression="zstd")
+        self.rows = []
+        for record in existing:
+            self.emit(record)
+
+    def emit(self, record):
+        self.rows.append({column: record.get(column) for column in self.COLUMNS})
+        if len(self.rows) >= self.ROW_GROUP_SIZE:
+            self.flush_rows()
+
+    def flush_rows(self):
+        import pyarrow as pa
+
+        if self.rows:
+            self.f.write_table(pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def checkpoint(self):
+        pass
+
+    def close(self):
+        self.flush_rows()
+        self.f.close()
+
+def open_response_writer(path, append=False, checkpoint_interval=16):
+    _, ext = split_responses_path(path)
+    if ext == ZSTD_SUFFIX:
+        return ZstdResponseWriter(path, append, checkpoint_interval)
+    if ext == PARQUET_SUFFIX:
+        return ParquetResponseWriter(path, append, checkpoint_interval)
+    return ResponseWriter(path, append, checkpoint_interval)
+
+def read_responses(path):
+    # Streams {"id", "completion", ...} records from any of the output formats
+    _, ext = split_responses_path(path)
+    if ext == PARQUET_SUFFIX:
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=1024):
+            yield from batch.to_pylist()
+        return
+
+    if ext == ZSTD_SUFFIX:
+        import zstandard
+
+        raw = open(path, 'rb')
+        f = io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True), encoding='utf-8')
+    else:
+        raw = f = open(path, 'r', encoding='utf-8')
+    with raw, f:
+        for line in f:
+            # A line without its newline was cut off mid-write
+            if not line.endswith('\n'):
+                break
+            if line.strip():
+                yield json.loads(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a responses file in any output format as JSONL for the CVDP import step")
+    parser.add_argument("responses_file", help="Responses in .jsonl, .jsonl.zst or .parquet")
+    parser.add_argument("-o", "--output", default=None, help="Output JSONL file (default: stdout)")
+    args = parser.parse_args()
+
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    for record in read_responses(args.responses_file):
+        out.write(json.dumps({"id": record["id"], "completion": record["completion"]}, ensure_ascii=False) + '\n')
+    if args.output:
+        out.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# Checks of the dataset snapshot, filters, version diff and prompt export
+import os
+import sys
+import json
+import itertools
+import subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cvdp_dataset import DatasetStore, snapshot, snapshot_is_current, open_records, load_hashes, dataset_diff, carry_over_responses, export_prompts, find_dataset_file, read_dataset
+from response_io import open_response_writer, read_responses
+
+SUBMODULE = os.path.join(ROOT, "cvdp_benchmark")
+
+# Accepts exactly the options run_samples.py passes to run_benchmark.py in results/vllm_experiment/run.log
+FAKE_RUN_BENCHMARK = '''
+import os, sys, json, argparse
+parser = argparse.ArgumentParser()
+parser.add_argument("--filename", required=True)
+parser.add_argument("--model", required=True)
+parser.add_argument("--threads", type=int, default=1)
+parser.add_argument("--prompts-responses-file", required=True)
+parser.add_argument("--prefix", required=True)
+args = parser.parse_args()
+assert args.model == "local_export" and os.path.isfile("run_benchmark.py")
+with open("calls.log", "a") as f:
+    f.write(" ".join(sys.argv[1:]) + "\\n")
+with open(args.filename) as src, open(args.prompts_responses_file, "w") as out:
+    for line in src:
+        out.write(json.dumps({"id": json.loads(line)["id"], "prompt": "built by the benchmark"}) + "\\n")
+'''
+
+def make_record(problem_id, category="cid003", difficulty="easy", prompt="Write the module."):
+    return {
+        "id": problem_id,
+        "categories": [category, difficulty],
+        "input": {"prompt": prompt, "context": {"docs/spec.md": "spec"}},
+        "output": {"context": {"rtl/top.sv": "module top; endmodule"}},
+        "harness": {"files": {"docker-compose.yml": "services:\n  direct:\n    image: x\n"}}
+    }
+
+def write_dataset(path, records):
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+    return str(path)
+
+@pytest.fixture
+def fake_benchmark(tmp_path):
+    checkout = tmp_path / "cvdp_benchmark"
+    checkout.mkdir()
+    (checkout / "run_benchmark.py").write_text(FAKE_RUN_BENCHMARK)
+    return checkout
+
+def test_snapshot_indexes_every_problem(tmp_path):
+    records = [make_record("cvdp_copilot_b_0002", "cid016", "hard"), make_record("cvdp_copilot_a_0001")]
+    records[0]["harness"]["files"]["docker-compose.yml"] = "services:\n  direct:\n    image: x\n  lint:\n    image: y\n"
+    dataset = write_dataset(tmp_path / "dataset.jsonl", records)
+    snapshot(dataset, str(tmp_path / "store"))
+    store = DatasetStore(str(tmp_path / "store"))
+    assert len(store) == 2 and store.ids() == ["cvdp_copilot_a_0001", "cvdp_copilot_b_0002"]
+    assert store.get("cvdp_copilot_b_0002") == records[0]
+    assert store.get("cvdp_copilot_c_0003") is None
+    assert store.fields(1) == {"id": "cvdp_copilot_b_0002", "category": "cid016", "difficulty": "hard", "harness_type": "direct,lint"}
+    assert store.metadata()["cvdp_copilot_a_0001"] == {"category": "cid003", "difficulty": "easy"}
+    # A store and the JSONL it came from read back the same records, in id order for the store
+    assert list(open_records(str(tmp_path / "store"))) == records[::-1]
+    assert list(open_records(dataset)) == records
+
+@pytest.fixture
+def store(tmp_path):
+    records = [make_record(f"cvdp_copilot_{name}_{i:04d}", category, difficulty)
+               for name, category, difficulty, count in (("fifo", "cid003", "easy", 12), ("lfsr", "cid003", "hard", 6), ("alu", "cid016", "medium", 6))
+               for i in range(count)]
+    records[0]["harness"]["files"]["docker-compose.yml"] = "services:\n  lint:\n    image: y\n"
+    snapshot(write_dataset(tmp_path / "dataset.jsonl", records), str(tmp_path / "store"))
+    return DatasetStore(str(tmp_path / "store"))
+
+def test_select_combines_filters(store):
+    ids = lambda rows: [store.fields(row)["id"] for row in rows]
+    assert len(store.select()) == 24
+    assert ids(store.select(id_glob="cvdp_copilot_lfsr_000[0-2]")) == [f"cvdp_copilot_lfsr_{i:04d}" for i in range(3)]
+    assert len(store.select(category="cid003")) == 18
+    assert len(store.select(category="cid003", difficulty="hard,medium")) == 6
+    assert len(store.select(id_glob="*alu*,*lfsr*", category="cid016")) == 6
+    assert ids(store.select(harness_type="lint")) == ["cvdp_copilot_fifo_0000"]
+    assert store.select(category="cid999") == []
+
+def test_stratified_sample_keeps_stratum_proportions(store):
+    rows = store.select(sample=8, seed=1)
+    strata = [(store.fields(row)["category"], store.fields(row)["difficulty"]) for row in rows]
+    assert len(rows) == len(set(rows)) == 8 and rows == sorted(rows)
+    assert {s: strata.count(s) for s in set(strata)} == {("cid003", "easy"): 4, ("cid003", "hard"): 2, ("cid016", "medium"): 2}
+    # The same seed draws the same problems; asking for more than match returns them all
+    assert store.select(sample=8, seed=1) == rows
+    assert store.select(sample=8, seed=2) != rows
+    assert store.select(category="cid016", sample=10) == store.select(category="cid016")
+
+def test_export_writes_the_subset_as_a_dataset(store, tmp_path):
+    output = tmp_path / "subset.jsonl"
+    subprocess.run([sys.executable, os.path.join(ROOT, "cvdp_dataset.py"), "export", store.store_dir, str(output),
+                    "--category", "cid003", "--difficulty", "hard"], check=True, capture_output=True)
+    assert [record["id"] for record in read_dataset(str(output))] == [f"cvdp_copilot_lfsr_{i:04d}" for i in range(6)]
+
+def test_snapshot_is_current_until_the_dataset_changes(tmp_path):
+    dataset, store = tmp_path / "dataset.jsonl", str(tmp_path / "store")
+    write_dataset(dataset, [make_record("cvdp_copilot_a_0001")])
+    assert not snapshot_is_current(str(dataset), store)
+    snapshot(str(dataset), store)
+    assert snapshot_is_current(str(dataset), store)
+    write_dataset(dataset, [make_record("cvdp_copilot_a_0001", prompt="Write it again.")])
+    assert not snapshot_is_current(str(dataset), store)
+
+def version_pair(tmp_path):
+    old = [make_record(f"cvdp_copilot_m_{i:04d}") for i in range(5)]
+    new = [dict(record) for record in old[1:]] + [make_record("cvdp_copilot_m_0005")]
+    new[0] = make_record("cvdp_copilot_m_0001", prompt="Write the module, now with a reset.")
+    new[1] = dict(new[1], harness={"files": {"docker-compose.yml": "services:\n  lint:\n    image: z\n"}})
+    new[2] = dict(new[2], input={"prompt": "Write the module.", "context": {"docs/spec.md": "spec v2"}})
+    return write_dataset(tmp_path / "old.jsonl", old), write_dataset(tmp_path / "new.jsonl", new)
+
+def test_diff_separates_model_input_from_harness_changes(tmp_path):
+    old, new = version_pair(tmp_path)
+    snapshot(new, str(tmp_path / "store"))
+    manifest = dataset_diff(load_hashes(old), load_hashes(str(tmp_path / "store")))
+    assert manifest["added"] == ["cvdp_copilot_m_0005"] and manifest["removed"] == ["cvdp_copilot_m_0000"]
+    assert manifest["changed"] == {"cvdp_copilot_m_0001": ["prompt"], "cvdp_copilot_m_0002": ["harness"], "cvdp_copilot_m_0003": ["context"]}
+    assert manifest["unchanged"] == ["cvdp_copilot_m_0004"]
+    # A harness-only change keeps its responses but is evaluated again
+    assert manifest["regenerate"] == ["cvdp_copilot_m_0001", "cvdp_copilot_m_0003", "cvdp_copilot_m_0005"]
+    assert manifest["reevaluate"] == ["cvdp_copilot_m_0001", "cvdp_copilot_m_0002", "cvdp_copilot_m_0003", "cvdp_copilot_m_0005"]
+
+@pytest.mark.parametrize("ext", [".jsonl", ".jsonl.zst"])
+def test_carry_over_keeps_only_still_valid_responses(tmp_path, ext):
+    old, new = version_pair(tmp_path)
+    manifest = dataset_diff(load_hashes(old), load_hashes(new))
+    old_responses, new_responses = str(tmp_path / f"old{ext}"), str(tmp_path / f"new{ext}")
+    with open_response_writer(old_responses) as writer:
+        for i in range(5):
+            for sample in range(2):
+                writer.write(f"cvdp_copilot_m_{i:04d}", f"response {i}/{sample}", sample)
+    assert carry_over_responses(manifest, old_responses, new_responses) == 4
+    assert [(r["id"], r["sample"]) for r in read_responses(new_responses)] == [
+        (f"cvdp_copilot_m_{i:04d}", sample) for i in (2, 4) for sample in range(2)]
+
+def test_prompts_are_exported_with_one_benchmark_run(tmp_path, fake_benchmark):
+    dataset = write_dataset(tmp_path / "dataset.jsonl", [make_record(f"cvdp_copilot_m_{i:04d}") for i in range(5)])
+    snapshot(dataset, str(tmp_path / "store"))
+    output, context = tmp_path / "exported_prompts.jsonl", tmp_path / "prompt_response.jsonl"
+    exported, missing, _ = export_prompts(str(tmp_path / "store"), str(fake_benchmark), str(output), str(context), str(tmp_path / "work"))
+    assert (exported, missing) == (5, [])
+    assert len((fake_benchmark / "calls.log").read_text().splitlines()) == 1
+    first = json.loads(context.read_text().splitlines()[0])
+    assert first == {"cvdp_copilot_m_0000": {"input": {"docs/spec.md": "spec"}, "output": {"rtl/top.sv": ""}, "obj": True}}
+
+def test_export_fails_when_the_benchmark_rejects_an_option(tmp_path, fake_benchmark):
+    (fake_benchmark / "run_benchmark.py").write_text(FAKE_RUN_BENCHMARK.replace('parser.add_argument("--threads", type=int, default=1)\n', ''))
+    dataset = write_dataset(tmp_path / "dataset.jsonl", [make_record("cvdp_copilot_m_0000")])
+    with pytest.raises(RuntimeError, match="exited with status 2"):
+        export_prompts(dataset, str(fake_benchmark), str(tmp_path / "exported_prompts.jsonl"))
+
+@pytest.mark.skipif(not os.path.isfile(os.path.join(SUBMODULE, "run_benchmark.py")), reason="cvdp_benchmark submodule not checked out")
+def test_export_against_the_submodule(tmp_path):
+    dataset_file = find_dataset_file()
+    if not dataset_file:
+        pytest.skip("no CVDP dataset in HF_HOME")
+    dataset = write_dataset(tmp_path / "dataset.jsonl", itertools.islice(read_dataset(dataset_file), 3))
+    exported, missing, _ = export_prompts(dataset, SUBMODULE, str(tmp_path / "exported_prompts.jsonl"), workdir=str(tmp_path / "work"))
+    assert (exported, missing) == (3, [])
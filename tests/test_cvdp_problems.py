@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# Checks of the prompt-side helpers: token budgets and output file parsing
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cvdp_problems import TokenBudgeter, file_block_regex, completion_problem
+
+def test_kv_saving_is_reported_per_sequence_and_batch(capsys):
+    budgeter = TokenBudgeter(4096)
+    budgeter.record(1024, requests=3)
+    budgeter.record(2048, requests=1)
+    budgeter.report(kv_bytes_per_token=512 * 1024, slots=8)
+    lines = capsys.readouterr().out.splitlines()
+    assert "11264 decode tokens fewer reserved" in lines[0]
+    # 2816 tokens fewer per sequence at 0.5 MiB each, not the run-wide total
+    assert lines[1] == "Worst-case KV cache saved: 1408.0 MiB per sequence, 11.00 GiB across 8 concurrent sequences"
+
+def test_file_block_regex_accepts_one_fenced_block_per_expected_file():
+    # Blocks follow each other in the expected order, separated by a blank line
+    files = ["rtl/fifo.sv", "verif/tb_fifo.py"]
+    pattern = re.compile(file_block_regex(files))
+    response = ("rtl/fifo.sv\n```systemverilog\nmodule fifo;\n  // `define and `` stay inside the block\n\nendmodule\n```\n\n"
+                "verif/tb_fifo.py\n```python\nimport cocotb\n```\n")
+    assert pattern.fullmatch(response)
+    # What the constrained output looks like is what the regeneration check accepts
+    assert completion_problem(response, files) is None
+
+def test_file_block_regex_rejects_other_shapes():
+    pattern = re.compile(file_block_regex(["rtl/a+b.v"]))
+    assert pattern.fullmatch("rtl/a+b.v\n```verilog\nmodule ab; endmodule\n```\n")
+    # The path is matched literally, the language follows the extension, and the block cannot end early
+    assert not pattern.fullmatch("rtl/aab.v\n```verilog\nmodule ab; endmodule\n```\n")
+    assert not pattern.fullmatch("rtl/a+b.v\n```systemverilog\nmodule ab; endmodule\n```\n")
+    assert not pattern.fullmatch("rtl/a+b.v\n```verilog\n```\nprose\n```\n")
+    assert not pattern.fullmatch("Here is the code:\nrtl/a+b.v\n```verilog\nmodule ab; endmodule\n```\n")
+    assert file_block_regex([]) is None
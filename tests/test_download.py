@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# Checks of the offline mirror: export, verified fetch, resume of interrupted blobs and the cached fast path
+import os
+import sys
+import hashlib
+import threading
+import functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from download import repo_cache_dir, export_mirror, download_from_mirror, fetch_blob
+
+COMMIT = "25aa15d6375da07ba538aaef7e732c133539d253"
+FILES = {
+    "cvdp_v1.0.2_nonagentic_code_generation_no_commercial.jsonl": b'{"id": "cvdp_copilot_lfsr_0001"}\n' * 5000,
+    "README.md": b"# CVDP\n"
+}
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    # Serves a byte range of a file, as a Hugging Face mirror behind a web server would
+    ranges = []
+
+    def send_head(self):
+        header = self.headers.get("Range")
+        path = self.translate_path(self.path)
+        if not header or not os.path.isfile(path):
+            return super().send_head()
+        self.ranges.append(header)
+        start = int(header.split("=")[1].rstrip("-"))
+        f = open(path, 'rb')
+        f.seek(start)
+        self.send_response(206)
+        self.send_header("Content-Length", str(os.path.getsize(path) - start))
+        self.end_headers()
+        return f
+
+    def log_message(self, *args):
+        pass
+
+def make_cache(hf_home):
+    # A cache as load_dataset leaves it: blobs, a snapshot of links to them and the ref of main
+    cache_dir = repo_cache_dir(str(hf_home))
+    snapshot_dir = os.path.join(cache_dir, "snapshots", COMMIT)
+    os.makedirs(snapshot_dir)
+    os.makedirs(os.path.join(cache_dir, "refs"))
+    for path, content in FILES.items():
+        with open(os.path.join(snapshot_dir, path), 'wb') as f:
+            f.write(content)
+    with open(os.path.join(cache_dir, "refs", "main"), 'w') as f:
+        f.write(COMMIT)
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    make_cache(tmp_path / "online")
+    monkeypatch.setenv("HF_HOME", str(tmp_path / "online"))
+    export_mirror(str(tmp_path / "mirror"))
+    monkeypatch.setenv("HF_HOME", str(tmp_path / "offline"))
+    return tmp_path / "mirror"
+
+@pytest.fixture
+def http_mirror(mirror):
+    RangeHandler.ranges = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(RangeHandler, directory=str(mirror)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+def read_snapshot(snapshot_dir):
+    return {path: open(os.path.join(snapshot_dir, path), 'rb').read() for path in FILES}
+
+def test_mirror_round_trip_and_cached_rerun(tmp_path, mirror, capsys):
+    snapshot_dir = download_from_mirror(str(mirror), "main", workers=2)
+    assert snapshot_dir.endswith(os.path.join("snapshots", COMMIT))
+    assert read_snapshot(snapshot_dir) == FILES
+    # A second run is answered from the cache, even with the mirror gone
+    os.rename(mirror, tmp_path / "gone")
+    assert download_from_mirror(str(mirror), "main") == snapshot_dir
+    assert "ネットワーク不使用" in capsys.readouterr().out
+
+def test_http_mirror_with_commit_revision(http_mirror):
+    assert read_snapshot(download_from_mirror(http_mirror, COMMIT, workers=2)) == FILES
+
+def test_checksum_mismatch_discards_the_blob(tmp_path, mirror):
+    content = FILES["README.md"]
+    sha256 = hashlib.sha256(content).hexdigest()
+    (mirror / "blobs" / sha256).write_bytes(b"# CVDQ\n")
+    blobs_dir = tmp_path / "blobs"
+    blobs_dir.mkdir()
+    with pytest.raises(ValueError, match="チェックサム不一致"):
+        fetch_blob(str(mirror), str(blobs_dir), sha256, len(content))
+    assert os.listdir(blobs_dir) == []
+
+@pytest.mark.parametrize("via_http", [False, True])
+def test_incomplete_blob_is_resumed(tmp_path, mirror, http_mirror, via_http):
+    content = FILES["cvdp_v1.0.2_nonagentic_code_generation_no_commercial.jsonl"]
+    sha256 = hashlib.sha256(content).hexdigest()
+    blobs_dir = tmp_path / "blobs"
+    blobs_dir.mkdir()
+    (blobs_dir / f"{sha256}.incomplete").write_bytes(content[:50000])
+    assert fetch_blob(http_mirror if via_http else str(mirror), str(blobs_dir), sha256, len(content))
+    assert (blobs_dir / sha256).read_bytes() == content
+    assert os.listdir(blobs_dir) == [sha256]
+    if via_http:
+        assert RangeHandler.ranges == ["bytes=50000-"]
+    # An existing blob is not fetched again
+    assert not fetch_blob(str(mirror), str(blobs_dir), sha256, len(content))
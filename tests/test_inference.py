@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# CPU-only checks of the inference driver and its backends, using the mock engine and the stub server
+import os
+import sys
+import json
+import threading
+import subprocess
+from collections import Counter, deque
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from inference_backends import GenerationRequest, MockBackend, OpenAIBackend
+from data_parallel import DataParallelBackend, CHUNK_SIZE
+from openai_stub_server import StubServer, make_handler
+from cvdp_problems import early_stop_offset
+from response_io import read_responses, open_response_writer
+from local_inference_vllm import reorder_responses
+
+def write_prompts(path, count, prompt=None):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            text = prompt or f"Write module m{i}. Your response will be saved directly to: rtl/m{i}.sv"
+            f.write(json.dumps({"id": f"p{i}", "prompt": text}) + '\n')
+
+def run_driver(*args):
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, "local_inference_vllm.py"), "--model", "test-model", *args],
+        capture_output=True, text=True, timeout=300
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+@pytest.fixture
+def stub_server():
+    server = StubServer(("127.0.0.1", 0), make_handler(MockBackend(), 0.0, 0.3))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+def test_steal_takes_tail_half_of_largest_shard():
+    backend = DataParallelBackend(MockBackend, 3)
+    shards = [deque(), deque(range(100, 110)), deque(range(200, 204))]
+    # An idle replica steals the second half of the largest shard, in order
+    assert backend.take(0, shards, deque()) == list(range(105, 110))
+    assert list(shards[1]) == list(range(100, 105))
+    # Its own shard comes first, and the shared queue before that
+    assert backend.take(2, shards, deque()) == list(range(200, 204))
+    assert backend.take(1, shards, deque(["resubmitted"])) == ["resubmitted"]
+
+def test_own_shard_is_taken_in_chunks():
+    backend = DataParallelBackend(MockBackend, 2)
+    shards = [deque(range(CHUNK_SIZE * 2)), deque()]
+    assert backend.take(0, shards, deque()) == list(range(CHUNK_SIZE))
+
+def test_data_parallel_merges_in_prompt_order(tmp_path):
+    prompts, responses = tmp_path / "prompts.jsonl", tmp_path / "responses.jsonl"
+    write_prompts(prompts, 96)
+    output = run_driver("--prompts-file", str(prompts), "--responses-file", str(responses),
+                        "--backend", "mock", "--data-parallel", "2", "--samples", "2", "--order", "file")
+    records = list(read_responses(str(responses)))
+    assert [(r["id"], r["sample"]) for r in records] == [(f"p{i}", k) for i in range(96) for k in range(2)]
+    # Both replicas took part
+    assert output.count(" requests, ") == 2
+    assert "Replica 0: 0 requests" not in output and "Replica 1: 0 requests" not in output
+
+def test_reorder_merges_sorted_runs_from_disk(tmp_path):
+    prompts, responses = tmp_path / "prompts.jsonl", tmp_path / "responses.jsonl"
+    write_prompts(prompts, 10)
+    order = [(f"p{i}", k) for i in range(10) for k in range(2)]
+    with open_response_writer(str(responses)) as writer:
+        for problem_id, sample in reversed(order):
+            writer.write(problem_id, f"{problem_id}/{sample}", sample)
+    reorder_responses(str(responses), str(prompts), run_records=3)
+    assert [(r["id"], r["sample"]) for r in read_responses(str(responses))] == order
+    assert sorted(os.listdir(tmp_path)) == ["prompts.jsonl", "responses.jsonl"]
+
+def test_http_client_retries_injected_failures(stub_server):
+    backend = OpenAIBackend(stub_server, "test-model", max_in_flight=8, max_retries=20, backoff=0.001)
+    requests = [GenerationRequest(str(i), f"prompt {i}", {"n": 2, "seed": i, "max_tokens": 64}) for i in range(40)]
+    results = list(backend.generate(requests))
+    assert sorted(r.request.request_id for r in results) == sorted(r.request_id for r in requests)
+    assert all(len(r.completions) == 2 for r in results)
+    assert backend.retries > 0
+
+def test_http_client_stops_early_once_files_are_emitted(stub_server):
+    backend = OpenAIBackend(stub_server, "test-model", max_retries=20, backoff=0.001)
+    requests = [GenerationRequest(str(i), f"prompt {i}", {"n": 1, "seed": i, "max_tokens": 2048}, f"p{i}", ["rtl/m.sv"]) for i in range(20)]
+    results = list(backend.generate(requests, stop_check=early_stop_offset))
+    stopped = [r.completions[0] for r in results if r.completions[0].finish_reason == "early_stop"]
+    assert stopped
+    assert all(c.text.endswith("```") for c in stopped)
+
+def test_mock_early_stop_trims_after_last_fence():
+    backend = MockBackend()
+    requests = [GenerationRequest(str(i), f"prompt {i}", {"n": 1, "seed": i, "max_tokens": 2048}, f"p{i}", ["rtl/m.sv"]) for i in range(20)]
+    for result in backend.generate(requests, stop_check=early_stop_offset):
+        completion = result.completions[0]
+        if completion.finish_reason == "early_stop":
+            assert completion.text.endswith("```")
+
+def test_folded_duplicates_stay_distinct_when_cached(tmp_path):
+    prompts, responses, cache = tmp_path / "prompts.jsonl", tmp_path / "responses.jsonl", tmp_path / "cache.db"
+    write_prompts(prompts, 6, prompt="Same prompt. Your response will be saved directly to: rtl/x.sv")
+    args = ("--prompts-file", str(prompts), "--responses-file", str(responses), "--backend", "mock",
+            "--samples", "2", "--fold-duplicates", "--cache-file", str(cache))
+    run_driver(*args)
+    first = [r["completion"] for r in read_responses(str(responses))]
+    output = run_driver(*args)
+    second = [r["completion"] for r in read_responses(str(responses))]
+    assert len(set(first)) == 12
+    assert sorted(second) == sorted(first)
+    assert "12 hits, 0 misses" in output
+
+def test_resume_skips_exact_sample_indices(tmp_path):
+    prompts, responses = tmp_path / "prompts.jsonl", tmp_path / "responses.jsonl"
+    write_prompts(prompts, 20)
+    args = ("--prompts-file", str(prompts), "--responses-file", str(responses), "--backend", "mock", "--samples", "3", "--early-stop")
+    run_driver(*args)
+    complete = sorted(responses.read_text().splitlines())
+    # Early-stopped samples finish out of order; keep an arbitrary prefix as if the run had been killed
+    responses.write_text("\n".join(responses.read_text().splitlines()[:10]) + "\n")
+    run_driver(*args, "--resume")
+    resumed = responses.read_text().splitlines()
+    assert sorted(resumed) == complete
+    assert Counter(json.loads(line)["id"] for line in resumed) == {f"p{i}": 3 for i in range(20)}
+
+def test_cached_rerun_does_not_load_the_backend(tmp_path):
+    prompts, responses, cache = tmp_path / "prompts.jsonl", tmp_path / "responses.jsonl", tmp_path / "cache.db"
+    write_prompts(prompts, 10)
+    args = ("--prompts-file", str(prompts), "--responses-file", str(responses), "--backend", "mock", "--cache-file", str(cache))
+    assert "Model loaded" in run_driver(*args)
+    assert "Model loaded" not in run_driver(*args)
+
+def test_streaming_http_client_with_cache(tmp_path, stub_server):
+    prompts, responses, cache = tmp_path / "prompts.jsonl", tmp_path / "responses.jsonl", tmp_path / "cache.db"
+    write_prompts(prompts, 30)
+    args = ("--prompts-file", str(prompts), "--responses-file", str(responses), "--endpoint", stub_server,
+            "--max-retries", "20", "--stream-window", "4", "--cache-file", str(cache))
+    run_driver(*args)
+    assert "30 hits, 0 misses" in run_driver(*args)
+    assert len(list(read_responses(str(responses)))) == 30
+
+def test_token_cache_fill_is_counted_apart_from_preflight(tmp_path):
+    prompts = tmp_path / "prompts.jsonl"
+    write_prompts(prompts, 40)
+    output = run_driver("--prompts-file", str(prompts), "--responses-file", str(tmp_path / "responses.jsonl"), "--backend", "mock", "--preflight")
+    assert "Token cache fill: 0 prompts already cached, 40 tokenized" in output
+    assert "Token cache: 40 prompts reused, 0 tokenized" in output
+
+@pytest.mark.parametrize("ext", [".jsonl.zst", ".parquet"])
+def test_resume_completes_compressed_and_columnar_output(tmp_path, ext):
+    prompts, responses = tmp_path / "prompts.jsonl", tmp_path / f"responses{ext}"
+    write_prompts(prompts, 12)
+    args = ("--prompts-file", str(prompts), "--responses-file", str(responses), "--backend", "mock", "--samples", "2")
+    run_driver(*args)
+    complete = sorted((r["id"], r["sample"], r["completion"]) for r in read_responses(str(responses)))
+    kept = list(read_responses(str(responses)))[:7]
+    responses.unlink()
+    with open_response_writer(str(responses)) as writer:
+        for r in kept:
+            writer.write(r["id"], r["completion"], r["sample"])
+    assert "found 7 existing responses" in run_driver(*args, "--resume")
+    assert sorted((r["id"], r["sample"], r["completion"]) for r in read_responses(str(responses))) == complete
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# Checks of the context-overflow triage run before generation
+import os
+import sys
+import json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from inference_backends import MockBackend
+from completion_cache import TokenCache
+from prompt_preflight import PromptTriage, FITS, TRUNCATE, SKIP
+
+def test_prompts_are_classified_against_the_context_window():
+    triage = PromptTriage(MockBackend(), context_length=1000, min_tokens=100)
+    assert triage.classify(200, 800) == FITS
+    assert triage.classify(500, 800) == TRUNCATE
+    assert triage.classify(950, 800) == SKIP
+    # Without a known context length everything is taken to fit
+    assert PromptTriage(MockBackend(), None, 100).classify(10 ** 6, 800) == FITS
+
+def test_filter_lowers_budgets_and_drops_what_cannot_fit(tmp_path):
+    backend = MockBackend()
+    prompts = {name: " ".join(["tok"] * length) for name, length in (("short", 50), ("long", 400), ("huge", 480))}
+    lengths = dict(zip(prompts, (len(ids) for ids in backend.tokenize(list(prompts.values())))))
+    triage = PromptTriage(backend, context_length=lengths["huge"] + 20, min_tokens=64, token_cache=TokenCache(str(tmp_path / "tokens.db")))
+    pending = [({"id": name, "prompt": prompt}, [0, 1]) for name, prompt in prompts.items()]
+    kept = [data["id"] for data, _ in triage.filter(pending, lambda data: 200)]
+    assert kept == ["short", "long"]
+    assert triage.max_tokens({"id": "short"}, 200) == 200
+    assert triage.max_tokens({"id": "long"}, 200) == lengths["huge"] + 20 - lengths["long"]
+    assert triage.counts == {FITS: 2, TRUNCATE: 2, SKIP: 2}
+    triage.write(str(tmp_path / "preflight.json"))
+    report = json.loads((tmp_path / "preflight.json").read_text())
+    assert [entry["id"] for entry in report["skipped"]] == ["huge"]
+    # A second pass finds every prompt's token ids in the cache
+    triage.token_counts(list(prompts.values()))
+    assert triage.token_cache.hits == 3
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# Checks of the responses file formats: round trips, crash recovery and appending on resume
+import os
+import sys
+import json
+import shutil
+import subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from response_io import open_response_writer, read_responses, split_responses_path
+
+FORMATS = [".jsonl", ".jsonl.zst", ".parquet"]
+
+def write_records(path, records, append=False, checkpoint_interval=16):
+    with open_response_writer(path, append, checkpoint_interval) as writer:
+        for record in records:
+            writer.write(record["id"], record["completion"], record["sample"], record["num_tokens"], record["finish_reason"])
+
+def make_records(start, count):
+    return [{"id": f"p{i}", "completion": f"```verilog\nmodule m{i}; // ü\nendmodule\n```", "sample": i % 3,
+             "num_tokens": 10 + i, "finish_reason": "stop"} for i in range(start, start + count)]
+
+def test_split_keeps_compound_suffix():
+    assert split_responses_path("out/responses.jsonl.zst") == ("out/responses", ".jsonl.zst")
+    assert split_responses_path("out/responses.parquet") == ("out/responses", ".parquet")
+
+@pytest.mark.parametrize("ext", FORMATS)
+def test_round_trip(tmp_path, ext):
+    path = str(tmp_path / f"responses{ext}")
+    write_records(path, make_records(0, 50))
+    records = list(read_responses(path))
+    # The JSONL formats keep only what the import step and --resume need; Parquet has a column for each field
+    expected = make_records(0, 50) if ext == ".parquet" else [{k: r[k] for k in ("id", "completion", "sample")} for r in make_records(0, 50)]
+    assert records == expected
+
+@pytest.mark.parametrize("ext", FORMATS)
+def test_append_on_resume_keeps_earlier_records(tmp_path, ext):
+    path = str(tmp_path / f"responses{ext}")
+    write_records(path, make_records(0, 5))
+    write_records(path, make_records(5, 5), append=True)
+    assert [r["id"] for r in read_responses(path)] == [f"p{i}" for i in range(10)]
+
+def test_zstd_keeps_every_checkpointed_frame_after_a_crash(tmp_path):
+    path, crashed = str(tmp_path / "responses.jsonl.zst"), str(tmp_path / "crashed.jsonl.zst")
+    writer = open_response_writer(path, checkpoint_interval=4)
+    for record in make_records(0, 10):
+        writer.write(record["id"], record["completion"], record["sample"])
+    # What a killed run leaves on disk: the frames ended at each checkpoint
+    shutil.copy(path, crashed)
+    writer.close()
+    assert [r["id"] for r in read_responses(crashed)] == [f"p{i}" for i in range(8)]
+
+def test_jsonl_skips_a_line_cut_off_mid_write(tmp_path):
+    path = tmp_path / "responses.jsonl"
+    write_records(str(path), make_records(0, 3))
+    path.write_text(path.read_text() + '{"id": "p3", "compl')
+    assert [r["id"] for r in read_responses(str(path))] == ["p0", "p1", "p2"]
+
+def test_conversion_writes_bare_import_records(tmp_path):
+    source, output = str(tmp_path / "responses.parquet"), tmp_path / "import.jsonl"
+    write_records(source, make_records(0, 3))
+    subprocess.run([sys.executable, os.path.join(ROOT, "response_io.py"), source, "-o", str(output)], check=True)
+    assert [json.loads(line) for line in output.read_text().splitlines()] == [{"id": r["id"], "completion": r["completion"]} for r in make_records(0, 3)]
@@ -9,6 +9,10 @@ pip3 install -r /workspace/cvdp_benchmark/requirements.txt
 
 # Step 2: HuggingFaceデータセットのパスを確認
 echo "Step 2: Locating HuggingFace dataset..."
+# エアギャップ環境では CVDP_MIRROR (ディレクトリ、file:// または http://localhost:PORT) からキャッシュへ取得
+if [ -n "$CVDP_MIRROR" ]; then
+    HF_HOME="${HF_HOME:-/data4/.cache/huggingface}" python3 /workspace/download.py --mirror "$CVDP_MIRROR" || exit 1
+fi
 DATASET_PATH=$(find /data4/.cache/huggingface/hub/datasets--nvidia--cvdp-benchmark-dataset -name "*.jsonl" | grep "cvdp.*nonagentic.*no_commercial" | head -1)
 if [ -z "$DATASET_PATH" ]; then
     echo "❌ データセットファイルが見つかりません"
@@ -18,31 +22,58 @@ if [ -z "$DATASET_PATH" ]; then
 fi
 echo "✅ データセットファイル: $DATASET_PATH"
 
+# 問題ID・カテゴリ・難易度・ハーネス種別で索引付けしたスナップショットを作成 (index.json の sha256 が一致すれば再作成しない)
+python3 /workspace/cvdp_dataset.py snapshot /workspace/data/cvdp_store --dataset-file "$DATASET_PATH" || exit 1
+
+# CVDP_SUBSET にフィルタを指定すると、その部分集合だけをエクスポート・評価する
+# 例: CVDP_SUBSET="--category cid003 --difficulty easy --sample 10"
+if [ -n "$CVDP_SUBSET" ]; then
+    python3 /workspace/cvdp_dataset.py export /workspace/data/cvdp_store /workspace/data/cvdp_subset.jsonl $CVDP_SUBSET
+    DATASET_PATH=/workspace/data/cvdp_subset.jsonl
+    echo "✅ 部分集合: $DATASET_PATH"
+fi
+
 # Step 3: プロンプトエクスポート
+# run_benchmark.py を local_export で1回だけ実行 (run_samples.py とDockerネットワークを経由しない)
+# 失敗した場合は従来どおりハーネス経由で1サンプルだけエクスポートする
 echo "Step 3: Exporting prompts..."
-python3 /workspace/cvdp_benchmark/run_samples.py \
-  -f "$DATASET_PATH" \
-  --model local_export \
-  --prompts-responses-file /workspace/data/exported_prompts.jsonl \
-  -n 3 \
-  -p /workspace/results/vllm_experiment
+if python3 /workspace/cvdp_dataset.py prompts "$DATASET_PATH" \
+  --benchmark /workspace/cvdp_benchmark \
+  -o /workspace/data/exported_prompts.jsonl \
+  --context-output /workspace/data/prompt_response.jsonl; then
+    echo "✅ run_benchmark.py から直接エクスポートしました"
+else
+    echo "⚠️ 直接エクスポートに失敗したため、ハーネス経由でエクスポートします"
+    rm -f /workspace/data/exported_prompts.jsonl
+    python3 /workspace/cvdp_benchmark/run_samples.py \
+      -f "$DATASET_PATH" \
+      --model local_export \
+      --prompts-responses-file /workspace/data/exported_prompts.jsonl \
+      -n 1 \
+      -p /workspace/results/vllm_export || exit 1
+fi
 
-# Step 4: vLLM推論
+# Step 4: vLLM推論 (INFERENCE_BACKEND=mock でGPUなしでもパイプライン全体を試験可能)
 echo "Step 4: Running vLLM inference..."
 python3 /workspace/local_inference_vllm.py \
   --prompts-file /workspace/data/exported_prompts.jsonl \
   --responses-file /workspace/data/responses.jsonl \
   --model "codellama/CodeLlama-7b-Instruct-hf" \
+  --backend "${INFERENCE_BACKEND:-vllm}" \
+  --dataset /workspace/data/cvdp_store \
   --samples 3 \
+  --max-regenerations 2 \
   --tensor-parallel-size 1 \
   --gpu-memory-utilization 0.8
 
 # Step 5: 結果インポートと評価
 echo "Step 5: Importing responses and evaluating..."
+# インポート側が読むのは id と completion のみ: sample などの追加キーを落としたファイルに変換して渡す
+python3 /workspace/response_io.py /workspace/data/responses.jsonl -o /workspace/data/responses_import.jsonl || exit 1
 python3 /workspace/cvdp_benchmark/run_samples.py \
   -f "$DATASET_PATH" \
   --model local_import \
-  --prompts-responses-file /workspace/data/responses.jsonl \
+  --prompts-responses-file /workspace/data/responses_import.jsonl \
   -n 3 \
   -p /workspace/results/vllm_experiment
 